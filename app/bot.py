@@ -1,32 +1,67 @@
 import asyncio
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 
-import yaml
 import json
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, CommandStart
-from aiogram.types import Message
+from aiogram.types import (
+    Chat,
+    Message,
+    MessageOriginChannel,
+    MessageOriginChat,
+    MessageOriginHiddenUser,
+    MessageOriginUser,
+    User,
+)
 from dotenv import load_dotenv
 
-from storage import init_db, ingest_raw_and_classify
-from rules_engine import load_rules, classify_text
-
-from storage import init_db, ingest_raw_and_classify, get_message_entities
-from storage import get_message_entities_multi, lookup_terminal_directory_by_azs_wp
+from db import connect_reader
+from entities_engine import get_entities_data
+from rules_engine import get_rules_data, compile_rules, classify_text
+from storage import (
+    MessageRow,
+    extract_message_entities,
+    get_message_entities_multi,
+    init_db,
+    lookup_terminal_directory_by_azs_wps,
+    select_azs_wps,
+)
+from storage_writer import StorageWriter
+from yaml_utils import load_yaml
+
+
+RULES_DATA = get_rules_data()
+COMPILED_RULES = compile_rules(RULES_DATA)
+RULESET_VERSION = str(RULES_DATA.get("ruleset_version", "0"))
+RESPONSE_ROLES = {"bank", "service_coordinator", "service_support"}
 
+# горячие вызовы на каждое сообщение — без поиска атрибутов
+_utcnow = datetime.now
+_fromtimestamp = datetime.fromtimestamp
+_UTC = timezone.utc
 
+# content_type (str-enum aiogram) -> признак медиа / тип служебного события
+_MEDIA_TYPES = frozenset({
+    "photo", "video", "document", "audio", "voice", "video_note", "animation", "sticker"
+})
+_SERVICE_TYPES = {
+    "new_chat_members": "new_chat_members",
+    "left_chat_member": "left_chat_member",
+    "pinned_message": "pinned_message",
+}
 
-RULES_DATA = load_rules()
-RULESET_VERSION = str(RULES_DATA.get("ruleset_version", "0"))
-RESPONSE_ROLES = {"bank", "service_coordinator", "service_support"}
+# длинные тексты (вставленные логи и т.п.) классифицируем вне event loop
+CLASSIFY_INLINE_MAX_LEN = 1024
 
 def load_config(project_root: Path) -> dict:
     config_path = project_root / "config.yaml"
-    return yaml.safe_load(config_path.read_text(encoding="utf-8")) or {}
+    return load_yaml(config_path) or {}
 
 
 def build_user_role_index(cfg: dict) -> dict[int, str]:
@@ -45,17 +80,59 @@ def build_user_role_index(cfg: dict) -> dict[int, str]:
     return roles
 
 
-def chat_alias_for(chat_id: int, cfg: dict) -> str | None:
-    for c in cfg.get("chats", []):
+@dataclass(frozen=True, slots=True)
+class ChatCfg:
+    alias: str | None
+    reply_in_groups: bool
+
+
+_CFG_TRUE = frozenset({"true", "yes", "on", "1"})
+_CFG_FALSE = frozenset({"false", "no", "off", "0"})
+
+
+def cfg_bool(value, default: bool, key: str) -> bool:
+    """Флаг из config.yaml: только bool или явные строки ("false", "no", ...); иначе — ошибка конфига."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        v = value.strip().lower()
+        if v in _CFG_TRUE:
+            return True
+        if v in _CFG_FALSE:
+            return False
+    raise RuntimeError(f"config.yaml: {key} must be a boolean (true/false), got {value!r}")
+
+
+def build_chat_index(cfg: dict, default_reply_in_groups: bool) -> dict[int, ChatCfg]:
+    chats: dict[int, ChatCfg] = {}
+    for item in cfg.get("chats", []) or []:
+        if not isinstance(item, dict):
+            continue
         try:
-            if int(c.get("chat_id")) == int(chat_id):
-                return c.get("alias")
-        except Exception:
+            cid = int(item.get("chat_id"))
+        except (TypeError, ValueError):
             continue
-    return None
+        # первое вхождение выигрывает — как при линейном поиске раньше
+        chats.setdefault(cid, ChatCfg(
+            alias=item.get("alias"),
+            reply_in_groups=cfg_bool(
+                item.get("reply_in_groups"), default_reply_in_groups, f"chats[chat_id={cid}].reply_in_groups"
+            ),
+        ))
+    return chats
 
 
 def message_to_raw_json(message: Message) -> str:
+    # pydantic v2 сериализует модель сразу в JSON (pydantic-core),
+    # без промежуточного dict и без json.dumps; кириллица не экранируется
+    try:
+        return message.model_dump_json()
+    except Exception:
+        pass
     try:
         data = message.model_dump()
     except Exception:
@@ -63,7 +140,51 @@ def message_to_raw_json(message: Message) -> str:
             data = message.to_python()
         except Exception:
             data = {"repr": repr(message)}
-    return json.dumps(data, ensure_ascii=False)
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _user_display(user: User) -> str | None:
+    return ((user.first_name or "") + " " + (user.last_name or "")).strip() or user.username or None
+
+
+def _chat_display(chat: Chat) -> str | None:
+    return chat.title or chat.username or None
+
+
+def forward_source(message: Message) -> tuple[int | None, str | None]:
+    """
+    (forward_from_id, forward_from_name) для пересланного сообщения.
+    В Bot API forward_origin бывает разных типов (user/chat/hidden_user/channel),
+    разбираем по типу; forward_from/forward_from_chat — fallback для старых апдейтов.
+    """
+    origin = message.forward_origin
+    if origin is None and message.forward_from is None and message.forward_from_chat is None:
+        # не пересылка — самый частый случай
+        return None, None
+
+    forward_from_id = None
+    forward_from_name = None
+
+    match origin:
+        case MessageOriginUser(sender_user=user):
+            forward_from_id = user.id
+            forward_from_name = _user_display(user)
+        case MessageOriginChat(sender_chat=chat) | MessageOriginChannel(chat=chat):
+            forward_from_id = chat.id
+            forward_from_name = _chat_display(chat)
+        case MessageOriginHiddenUser(sender_user_name=hidden):
+            forward_from_name = hidden or None
+
+    # Fallback для старых/особых случаев
+    if not forward_from_name and message.forward_from:
+        forward_from_id = message.forward_from.id
+        forward_from_name = _user_display(message.forward_from)
+
+    if not forward_from_name and message.forward_from_chat:
+        forward_from_id = message.forward_from_chat.id
+        forward_from_name = _chat_display(message.forward_from_chat)
+
+    return forward_from_id, forward_from_name
 
 
 def should_send_reply(cfg: dict) -> bool:
@@ -92,53 +213,55 @@ def build_reply_text(cfg: dict, entities: dict[str, str]) -> str:
 
     return "\n".join(parts).strip()
 
-def build_reply_text_multi(cfg: dict, sqlite_path: str, entities: dict[str, list[str]]) -> str:
-    reply_cfg = cfg.get("reply") or {}
-    include = set(reply_cfg.get("include_entities") or [])
-
-    azs = (entities.get("azs") or [None])[0]
-    wps = sorted({w for w in (entities.get("workplace") or []) if w})
-
-    if not azs or not wps:
-        return ""
-
-    lines = []
+def _gen_reply_lines(
+    azs: str, wps: list[str], include: set[str], matched: dict[str, tuple]
+):
     # Заголовок KE
     if "azs" in include and "workplace" in include:
-        lines.append(f"KE: АЗС {azs}, РМ " + ",".join(wps))
+        yield f"KE: АЗС {azs}, РМ " + ",".join(wps)
     else:
         # на всякий случай
-        lines.append(f"KE: АЗС {azs}")
-
-    found_any_tid = False
+        yield f"KE: АЗС {azs}"
 
-    # По каждому РМ — lookup в справочнике, чтобы корректно сопоставить tid/ip
+    show_tid = "tid" in include
+    show_ip = "ip" in include
     for wp in wps:
-        rows = lookup_terminal_directory_by_azs_wp(sqlite_path, azs, wp)
-
-        # require_unique_match по-хорошему должен быть и тут, но пока: если 1 строка — ок, иначе пропускаем
-        if len(rows) != 1:
+        row = matched.get(wp)
+        if row is None:
             continue
+        tid, ip, _arm = row
+        tid = tid if show_tid else None
+        ip = ip if show_ip else None
+        # если по этому РМ вообще нечего показывать — пропускаем строку
+        if tid and ip:
+            yield f"РМ {wp}: TID {tid} IP {ip}"
+        elif tid:
+            yield f"РМ {wp}: TID {tid}"
+        elif ip:
+            yield f"РМ {wp}: IP {ip}"
 
-        tid, ip, arm = rows[0]
-        if tid:
-            found_any_tid = True
 
-        parts = [f"РМ {wp}:"]
-        if "tid" in include and tid:
-            parts.append(f"TID {tid}")
-        if "ip" in include and ip:
-            parts.append(f"IP {ip}")
+def build_reply_text_multi(con, include: set[str], entities: dict[str, list[str]]) -> str:
+    azs, wps = select_azs_wps(entities.get("azs") or [], entities.get("workplace") or [])
 
-        # если по этому РМ вообще нечего показывать — пропускаем строку
-        if len(parts) > 1:
-            lines.append(" ".join(parts))
+    if not azs or not wps:
+        return ""
+
+    # lookup в справочнике одним запросом на все РМ, дальше сопоставляем tid/ip по каждому
+    rows_by_wp = lookup_terminal_directory_by_azs_wps(con, azs, wps)
+    # require_unique_match по-хорошему должен быть и тут, но пока: если 1 строка — ок, иначе пропускаем
+    matched = {wp: rows[0] for wp, rows in rows_by_wp.items() if len(rows) == 1}
 
     # ВАЖНО: если нет TID ни для одного РМ — не отвечаем вообще
-    if not found_any_tid:
+    if not any(row[0] for row in matched.values()):
         return ""
 
-    return "\n".join(lines).strip()
+    return "\n".join(_gen_reply_lines(azs, wps, include, matched)).strip()
+
+def _analyze_long_text(text: str):
+    # выполняется в рабочем потоке: весь regex-разбор длинного текста сразу
+    return classify_text(text, COMPILED_RULES), extract_message_entities(text)
+
 
 async def main() -> None:
     load_dotenv()
@@ -156,25 +279,68 @@ async def main() -> None:
         sqlite_path = project_root / sqlite_path  # всегда относительно корня проекта
     sqlite_path = str(sqlite_path)
 
-    reply_in_groups = bool(cfg.get("bot", {}).get("reply_in_groups", False))
+    reply_in_groups = cfg_bool(cfg.get("bot", {}).get("reply_in_groups"), False, "bot.reply_in_groups")
+    chat_by_id = build_chat_index(cfg, reply_in_groups)
+    store_raw_json = cfg_bool(cfg.get("storage", {}).get("store_raw_json"), True, "storage.store_raw_json")
 
-    init_db(sqlite_path)
+    # reply-конфиг читаем один раз на старте, а не на каждое сообщение
+    reply_cfg = cfg.get("reply") or {}
+    reply_enabled = should_send_reply(cfg)
+    reply_mode = str(reply_cfg.get("mode", "engineer_chat"))
+    reply_allowed_roles = reply_cfg.get("allowed_roles")
+    reply_include = set(reply_cfg.get("include_entities") or [])
+    reply_required = set(reply_cfg.get("require_entities") or [])
+    # engineer_chat_id нужен только в mode=engineer_chat — в остальных режимах его не проверяем
+    engineer_chat_id = reply_cfg.get("engineer_chat_id") if reply_mode == "engineer_chat" else None
+    try:
+        engineer_chat_id = int(engineer_chat_id) if engineer_chat_id else None
+    except (TypeError, ValueError):
+        raise RuntimeError(
+            f"config.yaml: reply.engineer_chat_id must be an integer chat id, got {engineer_chat_id!r}"
+        ) from None
 
-    logging.basicConfig(level=logging.INFO)
+    init_db(sqlite_path)
+    # битый entities.yaml — ошибка на старте, а не молча пустые КЕ в каждом сообщении
+    get_entities_data()
+
+    log_level = str((cfg.get("app") or {}).get("log_level") or "INFO").upper()
+    # только имена уровней (DEBUG, INFO, WARNING, ...): для них getLevelName отдаёт int
+    # (getLevelNamesMapping — лишь с Python 3.11); опечатка — INFO с предупреждением
+    level = logging.getLevelName(log_level)
+    logging.basicConfig(level=level if isinstance(level, int) else logging.INFO)
     log = logging.getLogger("tg-agent")
+    if not isinstance(level, int):
+        log.warning("config.yaml: unknown app.log_level %r, using INFO", log_level)
+
+    # запись — отдельный поток-писатель со своим соединением (storage_writer);
+    # чтение (сущности, справочник для reply) — своё соединение в своём потоке.
+    # В WAL читатель видит всё, что писатель закоммитил до выставления future
+    loop = asyncio.get_running_loop()
+    writer = await asyncio.to_thread(StorageWriter, sqlite_path, RULESET_VERSION, log)
+    db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-read")
+    con = await loop.run_in_executor(db_executor, connect_reader, sqlite_path)
+
+    async def run_db(fn, *args):
+        return await loop.run_in_executor(db_executor, fn, con, *args)
 
     bot = Bot(token=token)
     dp = Dispatcher()
 
+    def silent_in(chat) -> bool:
+        if chat.type not in ("group", "supergroup"):
+            return False
+        cc = chat_by_id.get(chat.id)
+        return not (cc.reply_in_groups if cc else reply_in_groups)
+
     @dp.message(CommandStart())
     async def start(message: Message):
-        if message.chat.type in ("group", "supergroup") and not reply_in_groups:
+        if silent_in(message.chat):
             return
         await message.answer("Привет! Я жив. Команда: /ping")
 
     @dp.message(Command("ping"))
     async def ping(message: Message):
-        if message.chat.type in ("group", "supergroup") and not reply_in_groups:
+        if silent_in(message.chat):
             return
         await message.answer("pong")
 
@@ -183,10 +349,11 @@ async def main() -> None:
 
     @dp.message()
     async def on_message(message: Message):
-        ts_utc = datetime.now(timezone.utc).isoformat()
+        ts_utc = _utcnow(_UTC).isoformat()
 
         chat_id = message.chat.id
-        alias = chat_alias_for(chat_id, cfg)
+        cc = chat_by_id.get(chat_id)
+        alias = cc.alias if cc else None
 
         from_id = message.from_user.id if message.from_user else None
         username = message.from_user.username if message.from_user else None
@@ -218,77 +385,33 @@ async def main() -> None:
                 reply_kind = "response"
 
 
-        # --- NEW: text может быть в caption (фото/док с подписью) ---
-        text = message.text or message.caption or ""
-
         # --- NEW: content_type + has_media без сохранения контента ---
-        content_type = getattr(message, "content_type", None) or "other"
-        has_media = 1 if content_type in {
-            "photo", "video", "document", "audio", "voice", "video_note", "animation", "sticker"
-        } else 0
-
-        # --- NEW: service events ---
-        service_action = None
-        if getattr(message, "new_chat_members", None):
-            content_type = "service"
-            has_media = 0
-            service_action = "new_chat_members"
-        elif getattr(message, "left_chat_member", None):
-            content_type = "service"
-            has_media = 0
-            service_action = "left_chat_member"
-        elif getattr(message, "pinned_message", None):
+        content_type = message.content_type or "other"
+        has_media = 1 if content_type in _MEDIA_TYPES else 0
+
+        # --- NEW: service events (определяем до текста: у них его нет) ---
+        service_action = _SERVICE_TYPES.get(content_type)
+        if service_action:
             content_type = "service"
             has_media = 0
-            service_action = "pinned_message"
-
-        forward_from_id = None
-        forward_from_name = None
-
-        origin = getattr(message, "forward_origin", None)
-        if origin:
-            # В Bot API forward_origin бывает разных типов (user/chat/hidden_user/channel и т.п.)
-            # aiogram даёт объект с полями, зависящими от типа. Пробуем аккуратно.
-            # 1) Если это forward от пользователя
-            user = getattr(origin, "sender_user", None)
-            if user:
-                forward_from_id = getattr(user, "id", None)
-                fn = getattr(user, "first_name", None) or ""
-                ln = getattr(user, "last_name", None) or ""
-                un = getattr(user, "username", None) or ""
-                forward_from_name = (fn + " " + ln).strip() or un or None
-
-            # 2) Если это forward из чата/канала
-            chat = getattr(origin, "sender_chat", None)
-            if chat and not forward_from_name:
-                forward_from_id = getattr(chat, "id", None)
-                forward_from_name = getattr(chat, "title", None) or getattr(chat, "username", None) or None
-
-            # 3) Если это скрытый пользователь (hidden user)
-            hidden = getattr(origin, "sender_user_name", None)
-            if hidden and not forward_from_name:
-                forward_from_name = hidden
-
-        # Fallback для старых/особых случаев
-        if not forward_from_name:
-            fwd_user = getattr(message, "forward_from", None)
-            if fwd_user:
-                forward_from_id = getattr(fwd_user, "id", None)
-                fn = getattr(fwd_user, "first_name", None) or ""
-                ln = getattr(fwd_user, "last_name", None) or ""
-                un = getattr(fwd_user, "username", None) or ""
-                forward_from_name = (fn + " " + ln).strip() or un or None
-
-        if not forward_from_name:
-            fwd_chat = getattr(message, "forward_from_chat", None)
-            if fwd_chat:
-                forward_from_id = getattr(fwd_chat, "id", None)
-                forward_from_name = getattr(fwd_chat, "title", None) or getattr(fwd_chat, "username", None) or None
+            text = ""
+        else:
+            # --- NEW: text может быть в caption (фото/док с подписью) ---
+            text = message.text or message.caption or ""
+
+        forward_from_id, forward_from_name = forward_source(message)
 
         # --- классификация (best-effort) ---
         match = None
+        # None — КЕ извлечёт поток БД (до открытия транзакции)
+        entities = None
         if text:
-            res = classify_text(text, RULES_DATA)
+            if len(text) > CLASSIFY_INLINE_MAX_LEN:
+                # длинный текст: и правила, и КЕ разбираем в одном заходе в поток
+                res, entities = await asyncio.to_thread(_analyze_long_text, text)
+            else:
+                # короткий текст дешевле проверить на месте, чем переключаться в поток
+                res = classify_text(text, COMPILED_RULES)
             if res:
                 match = {
                     "code": res.code,
@@ -296,47 +419,37 @@ async def main() -> None:
                     "weight": res.weight,
                 }
 
-        message_id = ingest_raw_and_classify(
-            db_path=sqlite_path,
-            m={
-                "ts_utc": ts_utc,
-                "chat_id": chat_id,
-                "chat_type": message.chat.type,
-                "chat_alias": alias,
-
-                "from_id": from_id,
-                "username": username,
-                "from_display": from_display,
-                "from_role": from_role,
-
-                "text": text,
-
-                "tg_message_id": message.message_id,
-                "reply_to_tg_message_id": reply_to_tg_message_id,
-
-                "reply_to_from_id": reply_to_from_id,
-                "reply_to_username": reply_to_username,
-                "reply_kind": reply_kind,
-
-                "content_type": content_type,
-                "has_media": has_media,
-                "service_action": service_action,
-
-                "edited_ts_utc": (
-                    message.edit_date.astimezone(timezone.utc).isoformat()
-                    if message.edit_date
-                    else None
-                ),
-
-                "forward_from_id": forward_from_id,
-                "forward_from_name": forward_from_name,
-
-                "raw_json": message_to_raw_json(message),
-            },
-            match=match,
-            ruleset_version=RULESET_VERSION,
+        row = MessageRow(
+            ts_utc=ts_utc,
+            chat_id=chat_id,
+            chat_type=message.chat.type,
+            from_id=from_id,
+            username=username,
+            text=text,
+            chat_alias=alias,
+            tg_message_id=message.message_id,
+            reply_to_tg_message_id=reply_to_tg_message_id,
+            reply_to_from_id=reply_to_from_id,
+            reply_to_username=reply_to_username,
+            from_display=from_display,
+            from_role=from_role,
+            reply_kind=reply_kind,
+            forward_from_id=forward_from_id,
+            forward_from_name=forward_from_name,
+            content_type=content_type,
+            has_media=has_media,
+            service_action=service_action,
+            # aiogram 3 отдаёт edit_date как unix-время (int)
+            edited_ts_utc=(
+                _fromtimestamp(message.edit_date, _UTC).isoformat()
+                if message.edit_date
+                else None
+            ),
+            raw_json=message_to_raw_json(message) if store_raw_json else None,
         )
 
+        message_id = await asyncio.wrap_future(writer.submit(row, match, entities))
+
 
         log.info(
             "saved raw message chat_id=%s tg_message_id=%s alias=%s content_type=%s has_media=%s",
@@ -347,56 +460,64 @@ async def main() -> None:
             has_media,
         )
 
-        # --- reply / notify (управляется config.yaml, по ролям) ---
+        # нет текста (сервисные события, медиа без подписи): классифицировать
+        # и искать КЕ нечего, reply не будет, эхо пустого текста невозможно
+        if not text:
+            return
 
-        reply_cfg = cfg.get("reply") or {}
-        log.info(
-            "reply_check enabled=%s mode=%s allowed_roles=%s from_id=%s from_role=%s reply_in_groups=%s",
-            reply_cfg.get("enabled", None),
-            reply_cfg.get("mode", None),
-            reply_cfg.get("allowed_roles", None),
-            from_id,
-            from_role,
-            reply_in_groups,
-        )
+        # --- reply / notify (управляется config.yaml, по ролям) ---
 
-        if should_send_reply(cfg):
+        # диагностика — только на DEBUG, чтобы не форматировать строку на каждое сообщение
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "reply_check enabled=%s mode=%s allowed_roles=%s from_id=%s from_role=%s reply_in_groups=%s",
+                reply_enabled,
+                reply_mode,
+                reply_allowed_roles,
+                from_id,
+                from_role,
+                reply_in_groups,
+            )
+
+        if reply_enabled:
             try:
-                reply_cfg = cfg.get("reply") or {}
-                mode = str(reply_cfg.get("mode", "engineer_chat"))
+                entities = await run_db(get_message_entities_multi, message_id)
 
-                entities = get_message_entities_multi(sqlite_path, message_id)
-
-                required = set((cfg.get("reply") or {}).get("require_entities") or [])
-                if required:
-                    missing = [k for k in required if not entities.get(k)]
+                if reply_required:
+                    missing = [k for k in reply_required if not entities.get(k)]
                     if missing:
-                        log.info("reply_skipped_missing_entities missing=%s entities=%s", missing, entities)
+                        log.debug("reply_skipped_missing_entities missing=%s entities=%s", missing, entities)
                         return            
                 
-                reply_text = build_reply_text_multi(cfg, sqlite_path, entities)
+                # lookup по справочнику идёт в SQLite — тоже вне event loop
+                reply_text = await run_db(build_reply_text_multi, reply_include, entities)
 
-                log.info("reply_ready mode=%s reply_text_len=%s entities=%s", mode, len(reply_text or ""), entities)
+                log.debug("reply_ready mode=%s reply_text_len=%s entities=%s", reply_mode, len(reply_text or ""), entities)
 
                 if reply_text:
-                    if mode == "engineer_chat":
-                        engineer_chat_id = reply_cfg.get("engineer_chat_id")
+                    if reply_mode == "engineer_chat":
                         if engineer_chat_id:
-                            await bot.send_message(int(engineer_chat_id), reply_text)
-                    elif mode == "reply":
+                            await bot.send_message(engineer_chat_id, reply_text)
+                    elif reply_mode == "reply":
                         await message.reply(reply_text)
             except Exception:
                 log.exception("reply_failed")
 
         # тихий режим в группах
-        if message.chat.type in ("group", "supergroup") and not reply_in_groups:
+        if silent_in(message.chat):
             return
 
         # В личке эхо оставляем. В группе до этой строки не дойдём из-за return выше.
         await message.answer(text)
 
 
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # дописываем то, что уже стоит в очереди, и гасим писателя
+        await asyncio.to_thread(writer.close)
+        await loop.run_in_executor(db_executor, con.close)
+        db_executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+# app/db.py
+"""
+Соединения с SQLite для всех процессов (бот, скрипты): PRAGMA, явные транзакции.
+Писатель в боте один и живёт в своём потоке (storage_writer.StorageWriter);
+чтение — отдельными соединениями из connect_reader(): в WAL читатели
+не ждут писателя и видят всё, что он уже закоммитил.
+"""
+from __future__ import annotations
+
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def tune_connection(con: sqlite3.Connection) -> None:
+    """
+    Общие PRAGMA для любого соединения с БД (бот, импорт справочника, backfill).
+    journal_mode=WAL хранится в самом файле БД, остальное — настройки соединения;
+    synchronous=NORMAL безопасен именно в WAL.
+    """
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA cache_size=-65536")  # 64 MiB
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+
+
+def connect(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Долгоживущее соединение процесса: держим его открытым, чтобы page cache
+    SQLite (он живёт в соединении) не терялся между сообщениями.
+    Транзакции управляются явно (BEGIN IMMEDIATE / COMMIT), PRAGMA — tune_connection().
+    check_same_thread=False — если соединение передаётся между потоками
+    (вызывающий сам гарантирует, что одновременно им пользуется один поток).
+    """
+    con = sqlite3.connect(
+        db_path,
+        isolation_level=None,
+        check_same_thread=check_same_thread,
+        cached_statements=256,
+    )
+    tune_connection(con)
+    return con
+
+
+@contextmanager
+def tx(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Явная транзакция на соединении из connect(): BEGIN IMMEDIATE сразу берёт
+    write-lock, COMMIT — один fsync на весь блок, при исключении — ROLLBACK.
+    """
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+def connect_reader(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """connect() только для чтения: случайная запись мимо писателя — ошибка, а не lock."""
+    con = connect(db_path, check_same_thread=check_same_thread)
+    con.execute("PRAGMA query_only=ON")
+    return con
@@ -1,13 +1,16 @@
 # app/entities_engine.py
 from __future__ import annotations
 
+import logging
 import re
 from dataclasses import dataclass
-from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import yaml
+from regex_utils import fuse_any, has_nested_quantifier
+from yaml_utils import load_if_changed, load_yaml
+
+log = logging.getLogger(__name__)
 
 ORDINAL_RU_TO_INT = {
     "перв": "1",
@@ -23,12 +26,17 @@ ORDINAL_RU_TO_INT = {
 }
 
 
+# "1,2,3" / "1 и 2" -> отдельные номера РМ
+_WORKPLACE_SPLIT_RE = re.compile(r"\b\d{1,2}\b")
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+
 # Project root = parent of /app
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENTITIES_PATH = BASE_DIR / "config" / "entities.yaml"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class EntityMatch:
     entity_type: str
     entity_value: str
@@ -44,8 +52,7 @@ class EntitiesValidationError(RuntimeError):
 def load_entities(path: Path = ENTITIES_PATH) -> Dict[str, Any]:
     if not path.exists():
         raise FileNotFoundError(f"Entities file not found: {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    data = load_yaml(path)
     if not isinstance(data, dict):
         raise EntitiesValidationError("Top-level YAML must be a mapping (dict).")
     return data
@@ -56,6 +63,7 @@ def validate_entities(data: Dict[str, Any]) -> None:
         raise EntitiesValidationError("patterns must be a mapping (dict).")
 
     patterns = data["patterns"]
+    extractor_version = str(data.get("extractor", "regex:v1"))
     for etype, rules in patterns.items():
         if not isinstance(etype, str) or not etype.strip():
             raise EntitiesValidationError("entity type key must be a non-empty string")
@@ -71,21 +79,54 @@ def validate_entities(data: Dict[str, Any]) -> None:
             conf = r.get("confidence", 0.5)
             if not isinstance(conf, (int, float)) or not (0.0 <= float(conf) <= 1.0):
                 raise EntitiesValidationError(f"patterns.{etype}.confidence must be 0..1")
-
-
-@lru_cache(maxsize=1)
-def get_entities_data() -> Dict[str, Any]:
+            # компилируем один раз здесь: битый regex — ошибка конфига, а не тихий пропуск
+            try:
+                r["_re"] = re.compile(r["regex"])
+            except re.error as e:
+                raise EntitiesValidationError(f"patterns.{etype}.{r['name']}: bad regex: {e}") from e
+            # re откатывается: вложенные неограниченные квантификаторы на подобранном тексте "вешают" ingest
+            if has_nested_quantifier(r["regex"]):
+                log.warning(
+                    "patterns.%s.%s: pattern %r nests unbounded quantifiers (catastrophic backtracking risk); "
+                    "use an atomic group (?>...) or a possessive quantifier",
+                    etype,
+                    r["name"],
+                    r["regex"],
+                )
+            lits = r.get("literals")
+            if lits is not None:
+                if not isinstance(lits, list) or not lits or not all(isinstance(x, str) and x for x in lits):
+                    raise EntitiesValidationError(f"patterns.{etype}.literals must be a non-empty list of strings")
+                r["_literals"] = tuple(x.casefold() for x in lits)
+            # всё, что зависит только от правила, — один раз здесь, а не на каждое сообщение
+            r["_confidence"] = float(conf)
+            r["_extractor_tag"] = f"{extractor_version}:{r['name']}"
+
+    # один проход "есть ли хоть что-то" до поштучного разбора (None — склеить не вышло)
+    data["_any_re"] = fuse_any(r["regex"] for rules in patterns.values() for r in rules)
+
+
+# кэш по mtime файла: правка entities.yaml подхватывается без перезапуска
+_entities_cache: Dict[str, Any] = {"mtime_ns": None, "data": None, "failed": False}
+
+
+def _load_validated_entities() -> Dict[str, Any]:
     data = load_entities()
     validate_entities(data)
     return data
 
 
+def get_entities_data() -> Dict[str, Any]:
+    return load_if_changed(
+        ENTITIES_PATH, _entities_cache, _load_validated_entities, (EntitiesValidationError,), log
+    )
+
+
 def _normalize(entity_type: str, value: str) -> str:
     v = (value or "").strip()
 
     if entity_type in ("azs", "workplace", "sd_ticket"):
-        digits = "".join(ch for ch in v if ch.isdigit())
-        return digits
+        return _NON_DIGIT_RE.sub("", v)
 
     if entity_type == "terminal":
         return v.upper()
@@ -104,78 +145,83 @@ def extract_entities(text: str, data: Optional[Dict[str, Any]] = None) -> List[E
     if data is None:
         data = get_entities_data()
 
+    # большинство сообщений без сущностей: отсекаем их одним поиском
+    any_re = data.get("_any_re")
+    if any_re is not None and any_re.search(text) is None:
+        return []
+
     extractor_version = str(data.get("extractor", "regex:v1"))
     patterns = data.get("patterns") or {}
 
     found: List[EntityMatch] = []
+    append = found.append
+    folded: Optional[str] = None
 
     for entity_type, rules in patterns.items():
+        is_workplace = entity_type == "workplace"
         for r in (rules or []):
-            name = str(r.get("name"))
-            regex = str(r.get("regex"))
-            confidence = float(r.get("confidence", 0.5))
+            # дешёвая проверка подстрок до запуска regex
+            lits = r.get("_literals")
+            if lits:
+                if folded is None:
+                    folded = text.casefold()
+                if not any(x in folded for x in lits):
+                    continue
+
+            extractor = r.get("_extractor_tag")
+            if extractor is not None:
+                confidence = r["_confidence"]
+            else:
+                # данные без validate_entities
+                confidence = float(r.get("confidence", 0.5))
+                extractor = f"{extractor_version}:{r.get('name')}"
+
+            # после validate_entities regex уже скомпилирован (битый — ошибка загрузки),
+            # так что поиск ниже re.error бросить не может
+            rx = r.get("_re")
+            if rx is None:
+                # данные без validate_entities: битый regex -> просто пропускаем
+                try:
+                    rx = re.compile(str(r.get("regex")))
+                except re.error:
+                    continue
+
+            for m in rx.finditer(text):
+                # берем первую группу, если есть; иначе whole match
+                raw = m.group(0)
+                val = m.group(1) if m.lastindex else raw
+                # группа не участвовала / пустое совпадение — нормализовать нечего
+                if not val:
+                    continue
+
+                # Особый случай: workplace может быть списком "1,2,3"
+                if is_workplace:
+                    # 1) список/цифры
+                    nums = _WORKPLACE_SPLIT_RE.findall(val)
+                    if nums:
+                        # findall уже вернул чистые цифры — _normalize не нужен
+                        for n in nums:
+                            append(EntityMatch(entity_type, n, raw, confidence, extractor))
+                        continue
 
-            try:
-                for m in re.finditer(regex, text):
-                    # берем первую группу, если есть; иначе whole match
-                    raw = m.group(0)
-                    val = m.group(1) if m.lastindex and m.lastindex >= 1 else raw
-
-                    # Особый случай: workplace может быть списком "1,2,3"
-                    if entity_type == "workplace":
-                        s = str(val)
-
-                        # 1) список/цифры
-                        nums = re.findall(r"\b\d{1,2}\b", s)
-                        if nums:
-                            for n in nums:
-                                norm = _normalize(entity_type, n)
-                                if norm:
-                                    found.append(EntityMatch(
-                                        entity_type=entity_type,
-                                        entity_value=norm,
-                                        entity_raw=raw,
-                                        confidence=confidence,
-                                        extractor=f"{extractor_version}:{name}",
-                                    ))
-                            continue
-
-                        # 2) порядковые слова -> цифры
-                        low = s.lower()
-                        mapped = None
-                        for k, v in ORDINAL_RU_TO_INT.items():
-                            if k in low:
-                                mapped = v
-                                break
-                        if mapped:
-                            norm = _normalize(entity_type, mapped)
-                            if norm:
-                                found.append(EntityMatch(
-                                    entity_type=entity_type,
-                                    entity_value=norm,
-                                    entity_raw=raw,
-                                    confidence=confidence,
-                                    extractor=f"{extractor_version}:{name}",
-                                ))
-                            continue
+                    # 2) порядковые слова -> цифры
+                    low = val.lower()
+                    mapped = None
+                    for k, v in ORDINAL_RU_TO_INT.items():
+                        if k in low:
+                            mapped = v
+                            break
+                    if mapped:
+                        norm = _normalize(entity_type, mapped)
+                        if norm:
+                            append(EntityMatch(entity_type, norm, raw, confidence, extractor))
+                        continue
  # важное: не падаем в общий путь
 
-                    norm = _normalize(entity_type, val)
-                    if not norm:
-                        continue
+                norm = _normalize(entity_type, val)
+                if not norm:
+                    continue
 
-                    found.append(
-                        EntityMatch(
-                            entity_type=entity_type,
-                            entity_value=norm,
-                            entity_raw=raw,
-                            confidence=confidence,
-                            extractor=f"{extractor_version}:{name}",
-                        )
-                    )
-
-            except re.error:
-                # битый regex -> просто пропускаем
-                continue
+                append(EntityMatch(entity_type, norm, raw, confidence, extractor))
 
     return found
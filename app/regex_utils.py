@@ -0,0 +1,140 @@
+# app/regex_utils.py
+from __future__ import annotations
+
+import re
+from typing import Iterable, Optional, Pattern
+
+# ведущие глобальные флаги: "(?i)..." -> флаги "i", остаток паттерна
+_LEADING_FLAGS_RE = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+# то, что ломается при склейке: ссылки на группы по номеру/имени и условные группы
+_UNFUSABLE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|\\g<")
+
+
+def _scoped(pattern: str) -> str:
+    m = _LEADING_FLAGS_RE.match(pattern)
+    if m:
+        flags, body = m.group(1), pattern[m.end():]
+        # в verbose-режиме "#" комментирует до конца строки — закрывающую скобку переносим
+        tail = "\n)" if "x" in flags else ")"
+        return f"(?{flags}:{body}{tail}"
+    return f"(?:{pattern})"
+
+
+def fuse_any(patterns: Iterable[str]) -> Optional[Pattern[str]]:
+    """
+    Склеивает паттерны в одну альтернацию для быстрой проверки
+    "совпадает ли хоть один": fused.search(text) is None <=> ни один не совпал.
+    Ведущие "(?i)" переводятся в "(?i:...)", чтобы флаг не действовал на соседей.
+    None — склеить нельзя (ссылки на группы, повторяющиеся имена групп и т.п.),
+    тогда вызывающий проверяет паттерны по одному.
+    """
+    parts = []
+    for pat in patterns:
+        if _UNFUSABLE_RE.search(pat):
+            return None
+        parts.append(_scoped(pat))
+    if not parts:
+        return None
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        return None
+
+
+# квантификатор после атома: "*", "+", "?", "{n}", "{n,m}", "{n,}" и суффикс lazy "?" / possessive "+"
+_QUANTIFIER_RE = re.compile(r"(?:([*+])|\?|\{\d*(,\d*)?\})([+?]?)")
+
+
+# префикс группы после "(?": флаги, затем ":", "=", "!", ">", "<=", "<!" или имя "P<name>" / "<name>"
+_GROUP_PREFIX_RE = re.compile(r"\?[aiLmsux-]*(?:P?<[^>=!]*>|<[=!]|[:=!>])?")
+
+# повторы, которые не могут съесть разделитель-пунктуацию (плюс одиночные литералы, кроме него самого)
+_SEP_SAFE_REPEATS = frozenset({"\\d", "\\s", "\\w"})
+
+
+def _literal(atom: str) -> Optional[str]:
+    # атом-литерал: "a", ",", "\\." -> символ; метасимволы и классы -> None
+    if len(atom) == 1 and atom not in ".^$":
+        return atom
+    if len(atom) == 2 and atom[0] == "\\" and not atom[1].isalnum():
+        return atom[1]
+    return None
+
+
+def _separated(group: dict) -> bool:
+    # итерации разделены обязательной пунктуацией, которую ни один повтор не съест:
+    # "(\d+\s*,\s*)+" — строку нельзя разбить на итерации по-разному
+    if group["alt"]:
+        return False
+    for sep in group["seps"]:
+        if all(t in _SEP_SAFE_REPEATS or _literal(t) not in (None, sep) for t in group["reps"]):
+            return True
+    return False
+
+
+def has_nested_quantifier(pattern: str) -> bool:
+    """
+    Грубая эвристика по тексту паттерна (best-effort, не разбор regex): True, если
+    группа с неограниченным квантификатором внутри сама повторяется неограниченно —
+    "(a+)+", "(\\w*\\s?)*", классическая форма катастрофического backtracking'а.
+    Ограниченные повторы ("\\d{1,2}"), атомарные группы "(?>...)", possessive "a++"
+    и итерации, разделённые обязательной пунктуацией ("(\\d+\\s*,\\s*)+"), не помечаются.
+    """
+    # стек открытых групп: атомарная?, была ли "|", разделители, неограниченные повторы внутри
+    stack: list = []
+    i, n = 0, len(pattern)
+    while i < n:
+        ch = pattern[i]
+        if ch == "(":
+            prefix = _GROUP_PREFIX_RE.match(pattern, i + 1) if pattern.startswith("(?", i) else None
+            stack.append({
+                "atomic": pattern.startswith("(?>", i),
+                "alt": False,
+                "seps": set(),
+                "reps": [],
+            })
+            i = prefix.end() if prefix else i + 1
+            continue
+        if ch == "|":
+            if stack:
+                stack[-1]["alt"] = True
+            i += 1
+            continue
+        # j — конец атома: экранированный символ, класс [...], ")" или обычный символ
+        if ch == "\\":
+            j = i + 2
+        elif ch == "[":
+            # "]" сразу после "[" или "[^" — литерал
+            j = i + 1
+            if j < n and pattern[j] == "^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            j += 1
+        else:
+            j = i + 1
+        atom = pattern[i:j]
+        # неограниченный и откатываемый: "*", "+", "{n,}" без possessive "+"
+        m = _QUANTIFIER_RE.match(pattern, j)
+        repeated = bool(m and (m.group(1) or m.group(2) == ",") and m.group(3) != "+")
+        if m:
+            j = m.end()
+        if ch == ")" and stack:
+            group = stack.pop()
+            if repeated and group["reps"] and not group["atomic"] and not _separated(group):
+                return True
+            # повторённая группа — неограниченный повтор и для внешней
+            repeated = repeated or bool(group["reps"])
+            atom = "()"
+        elif stack and not m:
+            # обязательный литерал-пунктуация: ",", "\." и т.п.
+            lit = _literal(atom)
+            if lit and not lit.isalnum() and not lit.isspace():
+                stack[-1]["seps"].add(lit)
+        if repeated and stack:
+            stack[-1]["reps"].append(atom)
+        i = j
+    return False
@@ -10,21 +10,28 @@ Usage (from /app):
 
 from __future__ import annotations
 
+import logging
 import re
 import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
 
-import yaml
+from regex_utils import has_nested_quantifier
+from yaml_utils import load_yaml
+
+log = logging.getLogger(__name__)
 
 
 # Project root = parent of /app
 BASE_DIR = Path(__file__).resolve().parent.parent
 RULES_PATH = BASE_DIR / "config" / "rules.yaml"
 
+# Any Unicode letter (Cyrillic, Latin, ...): digits, emoji and punctuation excluded
+_HAS_LETTER_RE = re.compile(r"[^\W\d_]")
+
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MatchResult:
     code: str
     rule_id: str
@@ -34,6 +41,17 @@ class MatchResult:
     matched_include: str
 
 
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    code: str
+    rule_id: str
+    priority: int
+    weight: float
+    hint_symptom: str
+    include_any: Tuple[Tuple[str, Pattern[str]], ...]
+    exclude_any: Tuple[Pattern[str], ...]
+
+
 class RulesValidationError(RuntimeError):
     pass
 
@@ -41,8 +59,7 @@ class RulesValidationError(RuntimeError):
 def load_rules(path: Path = RULES_PATH) -> Dict[str, Any]:
     if not path.exists():
         raise FileNotFoundError(f"Rules file not found: {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    data = load_yaml(path)
     if not isinstance(data, dict):
         raise RulesValidationError("Top-level YAML must be a mapping (dict).")
     return data
@@ -112,9 +129,30 @@ def validate_rules(data: Dict[str, Any]) -> Tuple[int, int]:
         if not all(isinstance(x, str) and x.strip() for x in exc):
             raise RulesValidationError(f"Rule {rid}: exclude_any must contain only non-empty strings (or be []).")
 
+        for pat in inc + exc:
+            try:
+                re.compile(pat)
+            except re.error as e:
+                raise RulesValidationError(f"Rule {rid}: bad regex {pat!r}: {e}") from e
+            # re backtracks: nested unbounded quantifiers can stall on a crafted message
+            if has_nested_quantifier(pat):
+                log.warning(
+                    "Rule %s: pattern %r nests unbounded quantifiers (catastrophic backtracking risk); "
+                    "use an atomic group (?>...) or a possessive quantifier",
+                    rid,
+                    pat,
+                )
+
     return (len(rules), len(codes))
 
 
+def get_rules_data() -> Dict[str, Any]:
+    # Loaded once per process (the bot compiles rules at import): no hot-reload here
+    data = load_rules()
+    validate_rules(data)
+    return data
+
+
 def _sorted_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     # Sort by priority desc, then weight desc, stable by file order
     def sort_key(r: Dict[str, Any]):
@@ -124,57 +162,81 @@ def _sorted_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return sorted(enabled_rules, key=sort_key, reverse=True)
 
 
-def classify_text(text: str, data: Dict[str, Any]) -> Optional[MatchResult]:
+def compile_rules(data: Dict[str, Any]) -> List[CompiledRule]:
+    """
+    Prepare rules for classify_text once: enabled rules only, sorted by
+    priority desc, then weight desc (stable by file order), regexes compiled.
+    Bad regexes (only possible if validate_rules was skipped) are logged with
+    the rule id and keep the old runtime semantics:
+      - include_any: patterns from the first bad one onward are dropped
+        (previously the scan stopped there as a non-match)
+      - exclude_any: bad patterns are ignored
+    """
+    compiled: List[CompiledRule] = []
+    for r in _sorted_rules(data.get("problem_rules") or []):
+        include_any: List[Tuple[str, Pattern[str]]] = []
+        for pat in r.get("include_any") or []:
+            try:
+                include_any.append((pat, re.compile(pat)))
+            except re.error as e:
+                log.warning("Rule %s: bad include regex %r dropped with the rest of include_any: %s", r.get("id"), pat, e)
+                break
+
+        exclude_any: List[Pattern[str]] = []
+        for pat in r.get("exclude_any") or []:
+            try:
+                exclude_any.append(re.compile(pat))
+            except re.error as e:
+                log.warning("Rule %s: bad exclude regex %r ignored: %s", r.get("id"), pat, e)
+                continue
+
+        compiled.append(
+            CompiledRule(
+                code=str(r.get("code")),
+                rule_id=str(r.get("id")),
+                priority=int(r.get("priority", 0)),
+                weight=float(r.get("weight", 0.0)),
+                hint_symptom=str(r.get("hint_symptom", "")),
+                include_any=tuple(include_any),
+                exclude_any=tuple(exclude_any),
+            )
+        )
+    return compiled
+
+
+def classify_text(text: str, rules: Sequence[CompiledRule]) -> Optional[MatchResult]:
     """
     Returns best matching rule result or None.
+    rules: output of compile_rules() (already filtered and ordered).
     Matching logic:
       - include_any: at least one regex must match
       - exclude_any: none must match
       - choose by priority desc, then weight desc (stable by file order)
+    Rules are keyword based, so a text without a single letter ("+", "12345",
+    emoji only) cannot match and skips the rule loop entirely.
     """
-    if not text:
+    if not text or _HAS_LETTER_RE.search(text) is None:
         return None
 
-    rules: List[Dict[str, Any]] = data.get("problem_rules") or []
-    candidates = _sorted_rules(rules)
-
-    for r in candidates:
-        include_any = r.get("include_any") or []
-        exclude_any = r.get("exclude_any") or []
-
+    for r in rules:
         matched_pat = None
-        for pat in include_any:
-            try:
-                if re.search(pat, text):
-                    matched_pat = pat
-                    break
-            except re.error:
-                # Bad regex in rule -> treat as non-match
-                matched_pat = None
+        for pat, rx in r.include_any:
+            if rx.search(text):
+                matched_pat = pat
                 break
 
         if not matched_pat:
             continue
 
-        excluded = False
-        for pat in exclude_any:
-            try:
-                if re.search(pat, text):
-                    excluded = True
-                    break
-            except re.error:
-                # Bad exclude regex -> ignore this exclude pattern
-                continue
-
-        if excluded:
+        if any(rx.search(text) for rx in r.exclude_any):
             continue
 
         return MatchResult(
-            code=str(r.get("code")),
-            rule_id=str(r.get("id")),
-            priority=int(r.get("priority", 0)),
-            weight=float(r.get("weight", 0.0)),
-            hint_symptom=str(r.get("hint_symptom", "")),
+            code=r.code,
+            rule_id=r.rule_id,
+            priority=r.priority,
+            weight=r.weight,
+            hint_symptom=r.hint_symptom,
             matched_include=str(matched_pat),
         )
 
@@ -202,8 +264,9 @@ def cmd_test() -> int:
     data = load_rules()
     rules_count, codes_count = validate_rules(data)
     print(f"OK: ruleset_version={data.get('ruleset_version')} rules={rules_count} codes={codes_count}")
+    rules = compile_rules(data)
     for t in _default_tests():
-        res = classify_text(t, data)
+        res = classify_text(t, rules)
         print("-" * 80)
         print("TEXT:", t)
         print("RESULT:", res)
@@ -215,9 +278,7 @@ def cmd_classify(args: List[str]) -> int:
         print("Usage: python rules_engine.py classify <text>")
         return 2
     text = " ".join(args)
-    data = load_rules()
-    validate_rules(data)
-    res = classify_text(text, data)
+    res = classify_text(text, compile_rules(get_rules_data()))
     print(res)
     return 0
 
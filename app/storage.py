@@ -1,12 +1,19 @@
+import logging
 import sqlite3
-from typing import Any, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Mapping, NamedTuple, Sequence, Tuple
 
 from pathlib import Path
 from typing import Optional
-from entities_engine import extract_entities
+from db import connect, tx
+from entities_engine import EntityMatch, extract_entities
+from yaml_utils import load_yaml
 
 from functools import lru_cache
-import yaml
+from operator import itemgetter
+
+log = logging.getLogger(__name__)
 
 
 DDL = """
@@ -34,8 +41,109 @@ CREATE TABLE IF NOT EXISTS message_entities (
   UNIQUE(message_id, entity_type, entity_value),
   FOREIGN KEY(message_id) REFERENCES messages(id) ON DELETE CASCADE
 );
-CREATE INDEX IF NOT EXISTS idx_message_entities_message_id ON message_entities(message_id);
-CREATE INDEX IF NOT EXISTS idx_message_entities_type_value ON message_entities(entity_type, entity_value);
+"""
+
+# вторичные индексы message_entities отдельно: with_bulk_load() снимает и пересоздаёт их
+DDL_MESSAGE_ENTITIES_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_message_entities_message_id ON message_entities(message_id)",
+    "CREATE INDEX IF NOT EXISTS idx_message_entities_type_value ON message_entities(entity_type, entity_value)",
+)
+
+# Колонки messages в порядке позиционной вставки (ingest_raw_and_classify / ingest_batch)
+class MessageRow(NamedTuple):
+    """Строка messages; порядок полей = порядок колонок в INSERT."""
+    ts_utc: str
+    chat_id: int
+    chat_type: Optional[str] = None
+    from_id: Optional[int] = None
+    username: Optional[str] = None
+    text: Optional[str] = None
+    chat_alias: Optional[str] = None
+    tg_message_id: Optional[int] = None
+    reply_to_tg_message_id: Optional[int] = None
+    reply_to_from_id: Optional[int] = None
+    reply_to_username: Optional[str] = None
+    from_display: Optional[str] = None
+    from_role: Optional[str] = None
+    reply_kind: Optional[str] = None
+    forward_from_id: Optional[int] = None
+    forward_from_name: Optional[str] = None
+    content_type: Optional[str] = None
+    has_media: Optional[int] = None
+    service_action: Optional[str] = None
+    edited_ts_utc: Optional[str] = None
+    raw_json: Optional[str] = None
+
+
+MESSAGE_COLUMNS = MessageRow._fields
+
+# значения колонок из dict одним C-вызовом; _MESSAGE_DEFAULTS — NULL для отсутствующих ключей
+_message_values = itemgetter(*MESSAGE_COLUMNS)
+_MESSAGE_DEFAULTS = dict.fromkeys(MESSAGE_COLUMNS)
+
+
+def _message_params(m: Mapping[str, Any]) -> Tuple[Any, ...]:
+    # обычный случай — все ключи на месте: без промежуточного dict
+    try:
+        return _message_values(m)
+    except KeyError:
+        return _message_values({**_MESSAGE_DEFAULTS, **m})
+
+_SQL_INSERT_MESSAGE = (
+    f"INSERT INTO messages({', '.join(MESSAGE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(MESSAGE_COLUMNS))})"
+)
+
+# SQL горячего пути — константы модуля: один и тот же текст запроса
+# берётся из кэша подготовленных выражений соединения, без повторного разбора
+_SQL_INSERT_CLASSIFICATION = """
+INSERT INTO message_classification (message_id, chat_id, tg_message_id)
+VALUES (?, ?, ?)
+ON CONFLICT(message_id) DO NOTHING
+"""
+
+# классифицированное сообщение — одним upsert полной строкой; created_at_utc берёт
+# DEFAULT таблицы. Неклассифицированные идут через _SQL_INSERT_CLASSIFICATION: NULL'ы
+# из общего шаблона затёрли бы серверные DEFAULT'ы (UNCLASSIFIED, is_unclassified = 1)
+_SQL_UPSERT_CLASSIFIED = """
+INSERT INTO message_classification (
+  message_id, chat_id, tg_message_id,
+  problem_domain, problem_symptom, rule_id, confidence, ruleset_version,
+  is_unclassified, classified_at_utc, updated_at_utc
+)
+VALUES (?, ?, ?, 'PROBLEM', ?, ?, ?, ?, 0, ?, ?)
+ON CONFLICT(message_id) DO UPDATE SET
+  problem_domain = excluded.problem_domain,
+  problem_symptom = excluded.problem_symptom,
+  rule_id = excluded.rule_id,
+  confidence = excluded.confidence,
+  ruleset_version = excluded.ruleset_version,
+  is_unclassified = 0,
+  classified_at_utc = excluded.classified_at_utc,
+  updated_at_utc = excluded.updated_at_utc
+"""
+
+_SQL_INSERT_ENTITY = """
+INSERT OR IGNORE INTO message_entities(
+  message_id, entity_type, entity_value, entity_raw, confidence, extractor, created_at_utc
+)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# tid / ip из terminal_directory: без raw, фиксированный extractor
+_SQL_INSERT_DIR_ENTITY = """
+INSERT OR IGNORE INTO message_entities(
+  message_id, entity_type, entity_value, entity_raw, confidence, extractor, created_at_utc
+)
+VALUES (?, ?, ?, NULL, ?, 'directory:v1', ?)
+"""
+
+_SQL_SELECT_ENTITIES = "SELECT entity_type, entity_value FROM message_entities WHERE message_id = ?"
+
+_SQL_LOOKUP_DIRECTORY = """
+SELECT tid, ip, arm
+FROM terminal_directory
+WHERE azs = ? AND plnum = ?
 """
 
 # Project root = parent of /app
@@ -43,35 +151,132 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 ENRICHMENT_CFG_PATH = BASE_DIR / "config" / "enrichment.yaml"
 
 
+@dataclass(frozen=True, slots=True)
+class _DirCfg:
+    """Секция terminal_directory из enrichment.yaml, разобранная один раз на процесс."""
+    enabled: bool
+    require_unique: bool
+    write_tid: bool
+    write_ip: bool
+    tid_conf: float
+    ip_conf: float
+
+
 @lru_cache(maxsize=1)
-def get_enrichment_cfg() -> dict:
+def get_enrichment_cfg() -> _DirCfg:
     if not ENRICHMENT_CFG_PATH.exists():
         # безопасный дефолт: enrichment выключен
-        return {"terminal_directory": {"enabled": False}}
-    with open(ENRICHMENT_CFG_PATH, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        data = {"terminal_directory": {"enabled": False}}
+    else:
+        data = load_yaml(ENRICHMENT_CFG_PATH) or {}
+
+    cfg = data.get("terminal_directory", {}) or {}
+    conf = cfg.get("confidence", {}) or {}
+    return _DirCfg(
+        enabled=bool(cfg.get("enabled", True)),
+        require_unique=bool(cfg.get("require_unique_match", True)),
+        write_tid=bool(cfg.get("write_tid", True)),
+        write_ip=bool(cfg.get("write_ip", True)),
+        tid_conf=float(conf.get("tid", 0.95)),
+        ip_conf=float(conf.get("ip", 0.8)),
+    )
+
 
+def _message_columns(con: sqlite3.Connection) -> set[str]:
+    # пустое множество — таблицы messages ещё нет (она создаётся вне init_db)
+    return {row[1] for row in con.execute("PRAGMA table_info(messages)").fetchall()}
 
-def _ensure_message_column(con: sqlite3.Connection, column: str, column_type: str) -> None:
-    cur = con.execute("PRAGMA table_info(messages)")
-    cols = {row[1] for row in cur.fetchall()}
+
+def _ensure_message_column(
+    con: sqlite3.Connection, cols: set[str], column: str, column_type: str
+) -> None:
     if not cols:
         return
     if column not in cols:
         con.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+        cols.add(column)
+
+
+def _ensure_message_index(
+    con: sqlite3.Connection, cols: set[str], name: str, columns: str
+) -> None:
+    # если таблицы ещё нет, индекс не трогаем
+    if not cols:
+        return
+    con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON messages({columns})")
+
+
+def _table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+# PRAGMA user_version БД, до которой init_db доводит схему messages
+SCHEMA_VERSION = 1
+
+
+def _migrate_messages(con: sqlite3.Connection) -> None:
+    cols = _message_columns(con)
+    if not cols:
+        # messages ещё нет (её создают вне init_db) — версию не поднимаем,
+        # миграции выполнятся при следующем init_db
+        return
+    _ensure_message_column(con, cols, "from_role", "TEXT")
+    _ensure_message_column(con, cols, "reply_kind", "TEXT")
+    # ISO-8601 UTC сортируется лексикографически = хронологически (DEC-009)
+    _ensure_message_index(con, cols, "idx_messages_ts_utc", "ts_utc")
+    # backfill_from_role и выборки по автору
+    _ensure_message_index(con, cols, "idx_messages_from_id", "from_id")
+    con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 
 def init_db(db_path: str) -> None:
+    # каталог БД создаём только здесь (один раз на старте), пути записи его не трогают
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(db_path) as con:
-        con.executescript(DDL_MESSAGE_ENTITIES)
-        _ensure_message_column(con, "from_role", "TEXT")
-        _ensure_message_column(con, "reply_kind", "TEXT")
-        con.commit()
+    con = connect(db_path)
+    try:
+        # одна явная транзакция на всю схему: миграция и user_version — атомарно
+        with tx(con):
+            con.execute(DDL_MESSAGE_ENTITIES)
+            for stmt in DDL_MESSAGE_ENTITIES_INDEXES:
+                con.execute(stmt)
+            # миграции messages — только пока версия схемы в файле меньше текущей
+            if con.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                _migrate_messages(con)
+            # terminal_directory создаётся импортом справочника; lookup идёт по (azs, plnum),
+            # а уникальный ключ (azs, arm, plnum) по plnum не помогает
+            if _table_exists(con, "terminal_directory"):
+                con.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_terminal_directory_azs_plnum "
+                    "ON terminal_directory(azs, plnum)"
+                )
+    finally:
+        con.close()
+
+
+@contextmanager
+def with_bulk_load(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Массовая загрузка (scripts/replay.py): вторичные индексы message_entities
+    снимаются на время загрузки и строятся заново один раз в конце — дешевле,
+    чем обновлять их на каждой вставке. Пока блок активен, выборки по
+    message_entities идут без индексов (медленно) — не запускать рядом с ботом.
+    UNIQUE(message_id, entity_type, entity_value) остаётся: на нём INSERT OR IGNORE.
+    Вызывать вне транзакции; индексы пересоздаются и при ошибке.
+    """
+    con.execute("DROP INDEX IF EXISTS idx_message_entities_type_value")
+    con.execute("DROP INDEX IF EXISTS idx_message_entities_message_id")
+    try:
+        yield con
+    finally:
+        with tx(con):
+            for stmt in DDL_MESSAGE_ENTITIES_INDEXES:
+                con.execute(stmt)
 
 
 def save_message(
-    db_path: str,
+    con: sqlite3.Connection,
     ts_utc: str,
     chat_id: int,
     chat_type: Optional[str],
@@ -81,108 +286,73 @@ def save_message(
     from_role: Optional[str] = None,
     reply_kind: Optional[str] = None,
 ) -> None:
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(db_path) as con:
+    with tx(con):
         con.execute(
             "INSERT INTO messages(ts_utc, chat_id, chat_type, from_id, username, text, from_role, reply_kind) VALUES(?,?,?,?,?,?,?,?)",
             (ts_utc, chat_id, chat_type, from_id, username, text, from_role, reply_kind),
         )
-        con.commit()
-
-def get_message_entities(db_path: str, message_id: int) -> dict[str, str]:
-    with sqlite3.connect(db_path) as con:
-        rows = con.execute(
-            "SELECT entity_type, entity_value FROM message_entities WHERE message_id=?",
-            (message_id,),
-        ).fetchall()
+
+
+def save_message_at(db_path: str, *args: Any, **kwargs: Any) -> None:
+    """Для скриптов: разовое соединение по пути; процесс с потоком сообщений — save_message(con, ...)."""
+    con = connect(db_path)
+    try:
+        save_message(con, *args, **kwargs)
+    finally:
+        con.close()
+
+
+def get_message_entities(con: sqlite3.Connection, message_id: int) -> dict[str, str]:
+    rows = con.execute(_SQL_SELECT_ENTITIES, (message_id,)).fetchall()
     # если вдруг несколько — берём первое; позже можем усилить
     d: dict[str, str] = {}
     for t, v in rows:
         d.setdefault(str(t), str(v))
     return d
 
-def save_message_raw(db_path: str, m: Mapping[str, Any]) -> None:
+def save_message_raw(con: sqlite3.Connection, m: Mapping[str, Any]) -> None:
     """
     Сохраняет raw-сообщение в messages, заполняя расширенные колонки.
     Все поля опциональны (кроме ts_utc и chat_id) — при отсутствии пишем NULL.
+    Соединение — из connect().
     """
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(db_path) as con:
-        con.execute(
-            """
-            INSERT INTO messages(
-              ts_utc, chat_id, chat_type, from_id, username, text,
-              chat_alias,
-              tg_message_id, reply_to_tg_message_id,
-              reply_to_from_id, reply_to_username,
-              from_display, from_role,
-              reply_kind,
-              forward_from_id, forward_from_name,
-              content_type, has_media, service_action,
-              edited_ts_utc,
-              raw_json
-            )
-            VALUES (?, ?, ?, ?, ?, ?,
-                    ?,
-                    ?, ?,
-                    ?, ?,
-                    ?,
-                    ?, ?,
-                    ?, ?,
-                    ?, ?, ?,
-                    ?,
-                    ?)
-            """,
-            (
-                m.get("ts_utc"),
-                m.get("chat_id"),
-                m.get("chat_type"),
-                m.get("from_id"),
-                m.get("username"),
-                m.get("text"),
+    with tx(con):
+        # отсутствующие ключи -> NULL; порядок значений = MESSAGE_COLUMNS
+        con.execute(_SQL_INSERT_MESSAGE, _message_params(m))
 
-                m.get("chat_alias"),
-
-                m.get("tg_message_id"),
-                m.get("reply_to_tg_message_id"),
-
-                m.get("reply_to_from_id"),
-                m.get("reply_to_username"),
+def lookup_terminal_directory(con: sqlite3.Connection, azs: str, plnum: str):
+    return con.execute(_SQL_LOOKUP_DIRECTORY, (azs, plnum)).fetchall()
 
-                m.get("from_display"),
-                m.get("from_role"),
-                m.get("reply_kind"),
 
-                m.get("forward_from_id"),
-                m.get("forward_from_name"),
+# кэш lookup'ов справочника для ingest: одни и те же (azs, РМ) повторяются постоянно.
+# Сбрасывается, когда справочник мог поменяться: другое соединение или
+# PRAGMA data_version (растёт после commit'а из другого соединения — импорт CSV)
+DIRECTORY_CACHE_MAX = 4096
+_dir_cache: dict[str, Any] = {"con": None, "data_version": None, "rows": {}}
 
-                m.get("content_type"),
-                m.get("has_media"),
-                m.get("service_action"),
 
-                m.get("edited_ts_utc"),
+def _sync_directory_cache(con: sqlite3.Connection) -> None:
+    # вызывается внутри write-транзакции: до её конца чужой commit невозможен
+    data_version = con.execute("PRAGMA data_version").fetchone()[0]
+    if _dir_cache["con"] is not con or _dir_cache["data_version"] != data_version:
+        _dir_cache["con"] = con
+        _dir_cache["data_version"] = data_version
+        _dir_cache["rows"] = {}
 
-                m.get("raw_json"),
-            ),
-        )
-        con.commit()
 
-def lookup_terminal_directory(con: sqlite3.Connection, azs: str, plnum: str):
-    return con.execute(
-        """
-        SELECT tid, ip, arm
-        FROM terminal_directory
-        WHERE azs = ? AND plnum = ?
-        """,
-        (azs, plnum),
-    ).fetchall()
+def _lookup_directory_cached(con: sqlite3.Connection, azs: str, plnum: str) -> list:
+    cache = _dir_cache["rows"]
+    key = (azs, plnum)
+    rows = cache.get(key)
+    if rows is None:
+        rows = lookup_terminal_directory(con, azs, plnum)
+        if len(cache) >= DIRECTORY_CACHE_MAX:
+            cache.clear()
+        cache[key] = rows
+    return rows
 
-def get_message_entities_multi(db_path: str, message_id: int) -> dict[str, list[str]]:
-    with sqlite3.connect(db_path) as con:
-        rows = con.execute(
-            "SELECT entity_type, entity_value FROM message_entities WHERE message_id=?",
-            (message_id,),
-        ).fetchall()
+def get_message_entities_multi(con: sqlite3.Connection, message_id: int) -> dict[str, list[str]]:
+    rows = con.execute(_SQL_SELECT_ENTITIES, (message_id,)).fetchall()
 
     d: dict[str, list[str]] = {}
     for t, v in rows:
@@ -190,192 +360,193 @@ def get_message_entities_multi(db_path: str, message_id: int) -> dict[str, list[
     return d
 
 
-def lookup_terminal_directory_by_azs_wp(db_path: str, azs: str, plnum: str):
-    with sqlite3.connect(db_path) as con:
-        return con.execute(
-            """
-            SELECT tid, ip, arm
-            FROM terminal_directory
-            WHERE azs = ? AND plnum = ?
-            """,
-            (azs, plnum),
-        ).fetchall()
+def lookup_terminal_directory_by_azs_wps(con: sqlite3.Connection, azs: str, plnums: Sequence[str]) -> dict[str, list]:
+    """
+    Один запрос на все РМ сразу: WHERE azs = ? AND plnum IN (...).
+    Возвращает {plnum: [(tid, ip, arm), ...]}; РМ без строк в результат не попадают.
+    """
+    plnums = list(plnums)
+    if not plnums:
+        return {}
+    placeholders = ",".join("?" * len(plnums))
+    rows = con.execute(
+        f"""
+        SELECT plnum, tid, ip, arm
+        FROM terminal_directory
+        WHERE azs = ? AND plnum IN ({placeholders})
+        """,
+        (azs, *plnums),
+    ).fetchall()
+
+    # ключ — строкой: plnum в справочнике бывает INTEGER, а РМ из сообщения — строка
+    by_plnum: dict[str, list] = {}
+    for plnum, tid, ip, arm in rows:
+        by_plnum.setdefault(str(plnum), []).append((tid, ip, arm))
+    return by_plnum
+
+def extract_message_entities(text: Optional[str]) -> List[EntityMatch]:
+    """
+    КЕ / реквизиты из текста сообщения — то, что ingest пишет в message_entities.
+    best-effort: ошибка разбора (в т.ч. битый entities.yaml) не должна мешать
+    сохранить raw-сообщение (DEC-001) — тогда сообщение просто без КЕ.
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    try:
+        return extract_entities(text)
+    except Exception:
+        log.exception("extract_entities_failed, storing message without entities")
+        return []
+
 
 def ingest_raw_and_classify(
-    db_path: str,
-    m: Mapping[str, Any],
+    con: sqlite3.Connection,
+    row: MessageRow,
     match: Optional[dict],
     ruleset_version: str,
+    entities: Optional[List[EntityMatch]] = None,
 ) -> int:
     """
     Сохраняет raw-сообщение и сразу пытается его классифицировать.
     Если классификация не удалась — сообщение остаётся UNCLASSIFIED.
+    row — MessageRow (значения колонок messages).
+    entities — уже извлечённые extract_message_entities(row.text); None — извлечь здесь.
+    Соединение — из connect(); пишет одной транзакцией.
+    """
+    return ingest_batch(con, [(row, match, entities)], ruleset_version)[0]
+
+
+def ingest_batch(
+    con: sqlite3.Connection,
+    items: Sequence[Tuple[MessageRow, Optional[dict], Optional[List[EntityMatch]]]],
+    ruleset_version: str,
+) -> List[int]:
+    """
+    То же, что ingest_raw_and_classify, но для пачки сообщений в одной транзакции:
+    один fsync на пачку вместо одного на сообщение. Соединение — из connect().
+    Возвращает messages.id в порядке items; при ошибке откатывается вся пачка.
     """
-    with sqlite3.connect(db_path) as con:
-        cur = con.execute(
-            """
-            INSERT INTO messages(
-              ts_utc, chat_id, chat_type, from_id, username, text,
-              chat_alias,
-              tg_message_id, reply_to_tg_message_id,
-              reply_to_from_id, reply_to_username,
-              from_display, from_role,
-              reply_kind,
-              forward_from_id, forward_from_name,
-              content_type, has_media, service_action,
-              edited_ts_utc,
-              raw_json
-            )
-            VALUES (?, ?, ?, ?, ?, ?,
-                    ?,
-                    ?, ?,
-                    ?, ?,
-                    ?,
-                    ?, ?,
-                    ?, ?,
-                    ?, ?, ?,
-                    ?,
-                    ?)
-            """,
+    # regex-разбор — до BEGIN: write-lock держим только на время INSERT'ов
+    prepared = [
+        (row, match, extract_message_entities(row.text) if entities is None else entities)
+        for row, match, entities in items
+    ]
+    with tx(con):
+        _sync_directory_cache(con)
+        return [
+            _ingest(con, row, match, entities, ruleset_version)
+            for row, match, entities in prepared
+        ]
+
+
+def select_azs_wps(azs_values: Iterable[str], wp_values: Iterable[str]) -> Tuple[Optional[str], List[str]]:
+    """
+    Одно правило выбора для enrichment и ответа бота: из нескольких АЗС — наименьшая
+    (как в индексе message_entities, по строке), РМ — отсортированные уникальные.
+    """
+    azs_val = min((v for v in azs_values if v), default=None)
+    wp_vals = sorted({v for v in wp_values if v})
+    return azs_val, wp_vals
+
+
+def _find_azs_wp(entities: Sequence[EntityMatch]) -> Tuple[Optional[str], List[str]]:
+    """АЗС и РМ из уже извлечённых сущностей — по select_azs_wps."""
+    return select_azs_wps(
+        (e.entity_value for e in entities if e.entity_type == "azs"),
+        (e.entity_value for e in entities if e.entity_type == "workplace"),
+    )
+
+
+def _enrich(
+    con: sqlite3.Connection,
+    message_id: int,
+    entities: Sequence[EntityMatch],
+    ts_utc: str,
+) -> None:
+    # azs / РМ — из entities в памяти, без обратного SELECT из message_entities
+    cfg = get_enrichment_cfg()
+    if not cfg.enabled:
+        return
+
+    azs_val, wp_vals = _find_azs_wp(entities)
+    if not azs_val or not wp_vals:
+        return
+
+    # tid/ip по всем РМ собираем в один список и пишем одним executemany
+    found: List[Tuple[int, str, str, float, str]] = []
+    for wp_val in wp_vals:
+        rows = _lookup_directory_cached(con, azs_val, wp_val)
+
+        if (not cfg.require_unique) or (len(rows) == 1):
+            if rows:
+                tid, ip, arm = rows[0]
+
+                if cfg.write_tid and tid:
+                    found.append((message_id, "tid", str(tid), cfg.tid_conf, ts_utc))
+
+                if cfg.write_ip and ip:
+                    found.append((message_id, "ip", str(ip), cfg.ip_conf, ts_utc))
+
+    if found:
+        con.executemany(_SQL_INSERT_DIR_ENTITY, found)
+
+
+def _ingest(
+    con: sqlite3.Connection,
+    row: MessageRow,
+    match: Optional[dict],
+    entities: List[EntityMatch],
+    ruleset_version: str,
+) -> int:
+    # все шаги ingest в рамках уже открытой транзакции; commit — на вызывающем
+    cur = con.execute(_SQL_INSERT_MESSAGE, row)
+    message_id = cur.lastrowid
+
+    # 1-2) строка классификации: с результатом — одним upsert со всеми полями,
+    # без результата — минимальная строка (остальное заполняют DEFAULT'ы: UNCLASSIFIED)
+    if match:
+        con.execute(
+            _SQL_UPSERT_CLASSIFIED,
             (
-                m.get("ts_utc"),
-                m.get("chat_id"),
-                m.get("chat_type"),
-                m.get("from_id"),
-                m.get("username"),
-                m.get("text"),
-                m.get("chat_alias"),
-                m.get("tg_message_id"),
-                m.get("reply_to_tg_message_id"),
-                m.get("reply_to_from_id"),
-                m.get("reply_to_username"),
-                m.get("from_display"),
-                m.get("from_role"),
-                m.get("reply_kind"),
-                m.get("forward_from_id"),
-                m.get("forward_from_name"),
-                m.get("content_type"),
-                m.get("has_media"),
-                m.get("service_action"),
-                m.get("edited_ts_utc"),
-                m.get("raw_json"),
+                message_id,
+                row.chat_id,
+                row.tg_message_id,
+                match.get("code"),
+                match.get("rule_id"),
+                float(match.get("weight", 0.0)),
+                ruleset_version,
+                row.ts_utc,
+                row.ts_utc,
             ),
         )
-        message_id = cur.lastrowid
-
-        # 1) гарантируем строку классификации
+    else:
         con.execute(
-            """
-            INSERT INTO message_classification (message_id, chat_id, tg_message_id)
-            VALUES (?, ?, ?)
-            ON CONFLICT(message_id) DO NOTHING
-            """,
-            (message_id, m.get("chat_id"), m.get("tg_message_id")),
+            _SQL_INSERT_CLASSIFICATION,
+            (message_id, row.chat_id, row.tg_message_id),
         )
 
-        # 2) если есть результат классификации — обновляем
-        if match:
-            con.execute(
-                """
-                UPDATE message_classification
-                SET
-                  problem_domain = 'PROBLEM',
-                  problem_symptom = ?,
-                  rule_id = ?,
-                  confidence = ?,
-                  ruleset_version = ?,
-                  is_unclassified = 0,
-                  classified_at_utc = ?,
-                  updated_at_utc = ?
-                WHERE message_id = ?
-                """,
+    # 3) КЕ / реквизиты (извлечены до транзакции) пишем в message_entities
+    if entities:
+        # все КЕ сообщения — одним executemany
+        con.executemany(
+            _SQL_INSERT_ENTITY,
+            [
                 (
-                    match.get("code"),
-                    match.get("rule_id"),
-                    float(match.get("weight", 0.0)),
-                    ruleset_version,
-                    m.get("ts_utc"),
-                    m.get("ts_utc"),
                     message_id,
-                ),
-            )
-
-        # 3) извлекаем КЕ / реквизиты (best-effort) и пишем в message_entities
-        text = (m.get("text") or "").strip()
-        if text:
-            entities = extract_entities(text)
-            for e in entities:
-                con.execute(
-                    """
-                    INSERT OR IGNORE INTO message_entities(
-                      message_id, entity_type, entity_value, entity_raw, confidence, extractor, created_at_utc
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        message_id,
-                        e.entity_type,
-                        e.entity_value,
-                        e.entity_raw,
-                        float(e.confidence),
-                        e.extractor,
-                        m.get("ts_utc"),
-                    ),
+                    e.entity_type,
+                    e.entity_value,
+                    e.entity_raw,
+                    float(e.confidence),
+                    e.extractor,
+                    row.ts_utc,
                 )
+                for e in entities
+            ],
+        )
+
+    # 4) enrichment из terminal_directory (best-effort):
+    # если есть azs+workplace -> ищем tid/ip в справочнике и пишем как сущности
+    _enrich(con, message_id, entities, row.ts_utc)
 
-        # 4) enrichment из terminal_directory (best-effort):
-        # если есть azs+workplace -> ищем tid/ip в справочнике и пишем как сущности
-        cfg = get_enrichment_cfg().get("terminal_directory", {}) or {}
-        if cfg.get("enabled", True):
-            require_unique = bool(cfg.get("require_unique_match", True))
-            write_tid = bool(cfg.get("write_tid", True))
-            write_ip = bool(cfg.get("write_ip", True))
-
-            conf = cfg.get("confidence", {}) or {}
-            tid_conf = float(conf.get("tid", 0.95))
-            ip_conf = float(conf.get("ip", 0.8))
-
-            ent = con.execute(
-                """
-                SELECT entity_type, entity_value
-                FROM message_entities
-                WHERE message_id = ?
-                """,
-                (message_id,),
-            ).fetchall()
-
-            azs_val = next((v for (t, v) in ent if t == "azs"), None)
-            wp_vals = sorted({v for (t, v) in ent if t == "workplace"})
-
-            if azs_val and wp_vals:
-                for wp_val in wp_vals:
-                    rows = lookup_terminal_directory(con, azs_val, wp_val)
-
-                    if (not require_unique) or (len(rows) == 1):
-                        if rows:
-                            tid, ip, arm = rows[0]
-
-                            if write_tid and tid:
-                                con.execute(
-                                    """
-                                    INSERT OR IGNORE INTO message_entities(
-                                    message_id, entity_type, entity_value, entity_raw, confidence, extractor, created_at_utc
-                                    )
-                                    VALUES (?, 'tid', ?, NULL, ?, 'directory:v1', ?)
-                                    """,
-                                    (message_id, str(tid), tid_conf, m.get("ts_utc")),
-                                )
-
-                            if write_ip and ip:
-                                con.execute(
-                                    """
-                                    INSERT OR IGNORE INTO message_entities(
-                                    message_id, entity_type, entity_value, entity_raw, confidence, extractor, created_at_utc
-                                    )
-                                    VALUES (?, 'ip', ?, NULL, ?, 'directory:v1', ?)
-                                    """,
-                                    (message_id, str(ip), ip_conf, m.get("ts_utc")),
-                                )
-
-        con.commit()
-        return message_id
+    return message_id
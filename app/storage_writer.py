@@ -0,0 +1,152 @@
+# app/storage_writer.py
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from db import connect
+from entities_engine import EntityMatch
+from storage import MessageRow, ingest_batch
+
+# запись в SQLite пачками: до WRITE_BATCH_MAX сообщений или WRITE_BATCH_WINDOW_S секунд
+WRITE_BATCH_MAX = 500
+WRITE_BATCH_WINDOW_S = 0.05
+
+_STOP = object()
+
+
+def _fail(futs, exc: BaseException) -> None:
+    for fut in futs:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+def _write_batch(con, items: list, ruleset_version: str, log: logging.Logger) -> list:
+    """Возвращает messages.id (или исключение) для каждого элемента items."""
+    try:
+        return ingest_batch(con, items, ruleset_version)
+    except (sqlite3.IntegrityError, sqlite3.DataError) as e:
+        if len(items) == 1:
+            return [e]
+        # одно битое сообщение не должно терять всю пачку — пишем по одному
+        log.exception("write_batch_failed size=%s, retrying one by one", len(items))
+        return [res for item in items for res in _write_batch(con, [item], ruleset_version, log)]
+    except Exception as e:
+        # ошибка не из-за строки (database is locked и т.п.): по одному было бы
+        # до busy_timeout на каждое сообщение — падает вся пачка сразу
+        log.exception("write_batch_failed size=%s", len(items))
+        return [e] * len(items)
+
+
+class StorageWriter:
+    """
+    Единственный писатель в БД: отдельный поток со своим соединением (из connect()),
+    очередь (row, match, entities, future) и пачки по одной транзакции — fsync
+    на пачку, а вызывающий ждёт только постановки в очередь.
+    messages.id отдаётся через concurrent.futures.Future (в asyncio — wrap_future).
+    """
+
+    def __init__(self, db_path: str, ruleset_version: str, log: Optional[logging.Logger] = None) -> None:
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._ruleset_version = ruleset_version
+        self._log = log or logging.getLogger(__name__)
+        # submit() и остановка потока — под одним lock: после _closed в очередь
+        # ничего не попадает, и слитый при выходе хвост — действительно весь
+        self._lock = threading.Lock()
+        self._closed = False
+        ready: Future = Future()
+        self._thread = threading.Thread(
+            target=self._run, args=(db_path, ready), name="sqlite-writer", daemon=True
+        )
+        self._thread.start()
+        # ошибка открытия БД — сразу у вызывающего, а не в первом submit
+        ready.result()
+
+    def submit(
+        self,
+        row: MessageRow,
+        match: Optional[dict],
+        entities: Optional[List[EntityMatch]] = None,
+    ) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("StorageWriter is closed or its thread has stopped")
+            self._q.put((row, match, entities, fut))
+        return fut
+
+    def close(self) -> None:
+        """Дописывает всё, что уже в очереди, и останавливает поток."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._q.put(_STOP)
+        self._thread.join()
+
+    def _run(self, db_path: str, ready: Future) -> None:
+        try:
+            con = connect(db_path)
+        except BaseException as e:
+            self._closed = True
+            ready.set_exception(e)
+            return
+        ready.set_result(None)
+
+        q = self._q
+        batch: list = []
+        exc: BaseException = RuntimeError("StorageWriter stopped")
+        try:
+            stop = False
+            while not stop:
+                item = q.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + WRITE_BATCH_WINDOW_S
+                while len(batch) < WRITE_BATCH_MAX:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = q.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                # отменённое ожидание не отменяет запись: сообщение всё равно сохраняем,
+                # результат просто некому отдать (RUNNING-future отменить уже нельзя)
+                wanted = [fut.set_running_or_notify_cancel() for *_, fut in batch]
+                results = _write_batch(con, [item[:3] for item in batch], self._ruleset_version, self._log)
+                for (*_, fut), res, want in zip(batch, results, wanted):
+                    if not want:
+                        continue
+                    if isinstance(res, Exception):
+                        fut.set_exception(res)
+                    else:
+                        fut.set_result(res)
+                batch = []
+        except BaseException as e:
+            # поток умирает — никто из ждущих future не должен висеть вечно
+            self._log.exception("storage_writer_crashed")
+            exc = RuntimeError(f"StorageWriter stopped: {e!r}")
+            exc.__cause__ = e
+        finally:
+            with self._lock:
+                self._closed = True
+            _fail((fut for *_, fut in batch), exc)
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    _fail((item[3],), exc)
+            con.close()
@@ -0,0 +1,60 @@
+# app/yaml_utils.py
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple, Type
+
+import yaml
+
+# libyaml-загрузчик, если PyYAML собран с ним; иначе чистый Python
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml(path: Path) -> Any:
+    """safe-загрузка YAML-файла (utf-8) одним загрузчиком для всех конфигов."""
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+
+def load_if_changed(
+    path: Path,
+    cache: Dict[str, Any],
+    load: Callable[[], Any],
+    errors: Tuple[Type[BaseException], ...],
+    log: logging.Logger,
+) -> Any:
+    """
+    Перечитывает конфиг через load(), только если сменился mtime файла.
+    Битая правка (errors, OSError, YAMLError) не роняет процесс: остаёмся на прошлой
+    версии и не перечитываем файл до следующего изменения. warning с путём и ошибкой —
+    один раз на переход в ошибку, а не на каждый вызов (файл удалён — stat падает всегда).
+    Без прошлой версии (первая загрузка) ошибка пробрасывается.
+    """
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except OSError as e:
+        # mtime не трогаем: вернётся тот же файл — это та же прошлая версия
+        return _keep_previous(path, cache, e, log)
+    if cache.get("mtime_ns") == mtime_ns:
+        return cache["data"]
+    try:
+        data = load()
+    except (OSError, yaml.YAMLError, *errors) as e:
+        # новая битая версия файла — снова в лог
+        cache["mtime_ns"] = mtime_ns
+        cache["failed"] = False
+        return _keep_previous(path, cache, e, log)
+    cache["data"] = data
+    cache["mtime_ns"] = mtime_ns
+    cache["failed"] = False
+    return data
+
+
+def _keep_previous(path: Path, cache: Dict[str, Any], e: BaseException, log: logging.Logger) -> Any:
+    if cache.get("data") is None:
+        raise e
+    if not cache.get("failed"):
+        cache["failed"] = True
+        log.warning("config_reload_failed path=%s error=%s, keeping previous version", path, e)
+    return cache["data"]
@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import argparse
 import sqlite3
+import sys
 from pathlib import Path
 from typing import Any
 
-import yaml
+# общие настройки соединения SQLite — в app/db.py, загрузка YAML — в app/yaml_utils.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from db import connect, tx  # noqa: E402
+from yaml_utils import load_yaml  # noqa: E402
 
 
 def load_config(path: Path) -> dict[str, Any]:
-    return yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    return load_yaml(path) or {}
 
 
 def build_user_role_index(cfg: dict[str, Any]) -> dict[int, str]:
@@ -47,29 +51,41 @@ def backfill_from_role(db_path: Path, roles: dict[int, str], dry_run: bool) -> i
         return 0
 
     updated = 0
-    with sqlite3.connect(str(db_path)) as con:
-        ensure_message_column(con, "from_role", "TEXT")
-        for user_id, role in roles.items():
+    con = connect(str(db_path))
+    try:
+        with tx(con):
+            ensure_message_column(con, "from_role", "TEXT")
+            # роли — во временную таблицу, дальше один запрос на все user_id
+            # (messages.from_id индексирован в init_db: idx_messages_from_id)
+            con.execute("CREATE TEMP TABLE _roles(uid INTEGER PRIMARY KEY, role TEXT NOT NULL)")
+            con.executemany("INSERT INTO _roles(uid, role) VALUES(?, ?)", roles.items())
             if dry_run:
-                cur = con.execute(
-                    "SELECT COUNT(*) FROM messages WHERE from_id = ? AND (from_role IS NULL OR from_role = '')",
-                    (user_id,),
+                counts = dict(
+                    con.execute(
+                        """
+                        SELECT from_id, COUNT(*)
+                        FROM messages
+                        WHERE from_id IN (SELECT uid FROM _roles) AND (from_role IS NULL OR from_role = '')
+                        GROUP BY from_id
+                        """
+                    ).fetchall()
                 )
-                count = int(cur.fetchone()[0])
-                if count:
-                    print(f"[dry-run] user_id={user_id} role={role} rows={count}")
+                for user_id, role in roles.items():
+                    count = counts.get(user_id)
+                    if count:
+                        print(f"[dry-run] user_id={user_id} role={role} rows={count}")
             else:
                 cur = con.execute(
                     """
                     UPDATE messages
-                    SET from_role = ?
-                    WHERE from_id = ? AND (from_role IS NULL OR from_role = '')
-                    """,
-                    (role, user_id),
+                    SET from_role = (SELECT role FROM _roles WHERE uid = messages.from_id)
+                    WHERE from_id IN (SELECT uid FROM _roles) AND (from_role IS NULL OR from_role = '')
+                    """
                 )
-                updated += cur.rowcount
-        if not dry_run:
-            con.commit()
+                updated = cur.rowcount
+            con.execute("DROP TABLE _roles")
+    finally:
+        con.close()
     if not dry_run:
         print(f"Updated rows: {updated}")
     return updated
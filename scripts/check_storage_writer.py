@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# storage_writer / storage — из app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import storage_writer  # noqa: E402
+from storage import MessageRow, init_db  # noqa: E402
+from storage_writer import StorageWriter  # noqa: E402
+
+# messages и message_classification в проде создаются вне кода — здесь минимальная схема
+SCHEMA = """
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_utc TEXT NOT NULL, chat_id INTEGER NOT NULL, chat_type TEXT, from_id INTEGER, username TEXT,
+    text TEXT, chat_alias TEXT, tg_message_id INTEGER, reply_to_tg_message_id INTEGER,
+    reply_to_from_id INTEGER, reply_to_username TEXT, from_display TEXT, forward_from_id INTEGER,
+    forward_from_name TEXT, content_type TEXT, has_media INTEGER, service_action TEXT,
+    edited_ts_utc TEXT, raw_json TEXT
+);
+CREATE TABLE message_classification (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER UNIQUE, chat_id INTEGER,
+    tg_message_id INTEGER, problem_domain TEXT DEFAULT 'UNCLASSIFIED', problem_symptom TEXT,
+    rule_id TEXT, confidence REAL, ruleset_version TEXT, is_unclassified INTEGER DEFAULT 1,
+    classified_at_utc TEXT, created_at_utc TEXT DEFAULT (datetime('now')), updated_at_utc TEXT
+);
+"""
+
+MATCH = {"code": "POS_OFFLINE", "rule_id": "check", "weight": 1.0}
+
+
+def _row(i: int, ts_utc: str | None = "2026-01-01T00:00:00+00:00") -> MessageRow:
+    return MessageRow(ts_utc=ts_utc, chat_id=-100, chat_type="group", text=f"check {i}", tg_message_id=i)
+
+
+def _make_db(path: Path) -> str:
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.close()
+    init_db(str(path))
+    return str(path)
+
+
+def _count(db: str, table: str) -> int:
+    con = sqlite3.connect(db)
+    try:
+        return con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    finally:
+        con.close()
+
+
+def _expect_error(fn, exc_type, what: str) -> BaseException:
+    try:
+        fn()
+    except exc_type as e:
+        return e
+    raise SystemExit(f"FAIL: {what}: no {exc_type.__name__}")
+
+
+def check_batching(tmp: Path, log: logging.Logger) -> None:
+    db = _make_db(tmp / "batching.db")
+    writer = StorageWriter(db, "check", log)
+    n = storage_writer.WRITE_BATCH_MAX * 2 + 7
+    futs = [writer.submit(_row(i), MATCH if i % 2 else None) for i in range(n)]
+    ids = [f.result(timeout=30) for f in futs]
+    writer.close()
+    if len(set(ids)) != n or _count(db, "messages") != n or _count(db, "message_classification") != n:
+        raise SystemExit(f"FAIL: batching: ids={len(set(ids))} rows={_count(db, 'messages')} expected={n}")
+    print(f"ok batching: {n} messages")
+
+
+def check_one_by_one_retry(tmp: Path, log: logging.Logger) -> None:
+    db = _make_db(tmp / "retry.db")
+    writer = StorageWriter(db, "check", log)
+    # пачка уходит в одну транзакцию: битая строка (ts_utc NOT NULL) откатывает её целиком
+    futs = [writer.submit(_row(i, ts_utc=None if i == 3 else "2026-01-01T00:00:00+00:00"), None) for i in range(10)]
+    err = _expect_error(lambda: futs[3].result(timeout=30), sqlite3.IntegrityError, "retry: bad row")
+    ok = [f.result(timeout=30) for i, f in enumerate(futs) if i != 3]
+    writer.close()
+    if len(ok) != 9 or _count(db, "messages") != 9:
+        raise SystemExit(f"FAIL: retry: saved={_count(db, 'messages')} expected=9")
+    print(f"ok one-by-one retry: 9 saved, bad row -> {type(err).__name__}")
+
+
+def check_locked_db(tmp: Path, log: logging.Logger) -> None:
+    db = _make_db(tmp / "locked.db")
+    writer = StorageWriter(db, "check", log)
+    # чужой write-lock: "database is locked" — не ошибка строки, пачка падает целиком,
+    # без повтора по одному (иначе busy_timeout на каждое сообщение)
+    holder = sqlite3.connect(db, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        futs = [writer.submit(_row(i), None) for i in range(20)]
+        for f in futs:
+            _expect_error(lambda: f.result(timeout=60), sqlite3.OperationalError, "locked: batch")
+        elapsed = time.monotonic() - started
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    # одна попытка на пачку — один busy_timeout (5 с по умолчанию), а не 20
+    if elapsed > 15:
+        raise SystemExit(f"FAIL: locked: batch took {elapsed:.1f}s, retried one by one?")
+    ok = writer.submit(_row(0), None).result(timeout=30)
+    writer.close()
+    print(f"ok locked db: batch failed at once ({elapsed:.1f}s), next write -> id {ok}")
+
+
+def check_close(tmp: Path, log: logging.Logger) -> None:
+    db = _make_db(tmp / "close.db")
+    writer = StorageWriter(db, "check", log)
+    futs = [writer.submit(_row(i), None) for i in range(50)]
+    writer.close()
+    # close() дописывает очередь до остановки потока
+    if not all(f.done() and f.exception() is None for f in futs) or _count(db, "messages") != 50:
+        raise SystemExit("FAIL: close: queue not flushed")
+    _expect_error(lambda: writer.submit(_row(0), None), RuntimeError, "submit after close")
+    writer.close()
+    print("ok close: queue flushed, submit after close raises")
+
+
+class _Crash(BaseException):
+    pass
+
+
+def check_thread_crash(tmp: Path, log: logging.Logger) -> None:
+    db = _make_db(tmp / "crash.db")
+    writer = StorageWriter(db, "check", log)
+
+    def boom(*args):
+        raise _Crash()
+
+    orig = storage_writer._write_batch
+    storage_writer._write_batch = boom
+    try:
+        futs = [writer.submit(_row(i), None) for i in range(20)]
+        for f in futs:
+            _expect_error(lambda: f.result(timeout=30), RuntimeError, "crash: pending future")
+        writer._thread.join(timeout=30)
+    finally:
+        storage_writer._write_batch = orig
+    _expect_error(lambda: writer.submit(_row(0), None), RuntimeError, "submit after crash")
+    writer.close()
+    print("ok thread crash: pending futures failed, submit raises")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Smoke check of StorageWriter on a temporary SQLite DB")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Show writer log output")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    log = logging.getLogger("check_storage_writer")
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        check_batching(tmp, log)
+        check_one_by_one_retry(tmp, log)
+        check_locked_db(tmp, log)
+        check_close(tmp, log)
+        check_thread_crash(tmp, log)
+    print("StorageWriter: all checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,18 +3,50 @@ from __future__ import annotations
 import argparse
 import csv
 import re
-import sqlite3
+import sys
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
 
+# общие настройки соединения SQLite — в app/db.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from db import connect, tx  # noqa: E402
+
 
 TID_RE = re.compile(r"\b(\d{8})\b")  # terminal_id = ровно 8 цифр
+NON_DIGIT_RE = re.compile(r"\D+")
+
+CHUNK_SIZE = 10_000
+
+SQL_UPSERT_DIRECTORY = """
+INSERT INTO terminal_directory(
+  azs, arm, plnum,
+  ip, tid, serial_number,
+  val_raw, src_timestamp, source_file, imported_at_utc
+)
+VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?)
+ON CONFLICT(azs, arm, plnum) DO UPDATE SET
+  ip=excluded.ip,
+  tid=excluded.tid,
+  val_raw=excluded.val_raw,
+  src_timestamp=excluded.src_timestamp,
+  source_file=excluded.source_file,
+  imported_at_utc=excluded.imported_at_utc
+"""
 
 
 def norm_digits(s: str) -> str:
-    if s is None:
-        return ""
-    return "".join(ch for ch in str(s).strip() if ch.isdigit())
+    # одна C-замена вместо обхода по символам
+    return NON_DIGIT_RE.sub("", s) if s else ""
+
+
+# строгость форматов без regex на каждую строку; после norm_digits остаются только \d
+def _is_azs(s: str) -> bool:
+    return 2 <= len(s) <= 4 and s.isdecimal()
+
+
+def _is_plnum(s: str) -> bool:
+    return 1 <= len(s) <= 2 and s.isdecimal()
 
 
 def pick_tid(val_raw: str) -> str:
@@ -28,6 +60,51 @@ def pick_tid(val_raw: str) -> str:
     return m.group(1) if m else ""
 
 
+def iter_rows(reader, header, source_file: str, imported_at_utc: str):
+    """
+    Строки CSV -> кортежи для SQL_UPSERT_DIRECTORY; невалидные строки пропускаются.
+    source_file / imported_at_utc — константы всего импорта: вычисляются один раз
+    в main() и попадают в кортеж строки как есть, без пересборки.
+    """
+    # индексы колонок — один раз по заголовку; BOM мог остаться на первом имени
+    idx = {name.strip().lstrip("\ufeff"): i for i, name in enumerate(header)}
+    # отсутствующая колонка смотрит в "пустую" ячейку сразу за последней
+    width = len(header) + 1
+    missing = width - 1
+    azs_i = idx.get("AZS", missing)
+    arm_i = idx.get("ARM", missing)
+    plnum_i = idx.get("PlNum", missing)
+    ip_i = idx.get("IP", missing)
+    ip_alt_i = idx.get("Ip", missing)
+    val_i = idx.get("Val", missing)
+    ts_i = idx.get("Timestamp", missing)
+
+    for r in reader:
+        # короткие и пустые строки добиваем до ширины заголовка (как restval у DictReader)
+        if len(r) < width:
+            r += [""] * (width - len(r))
+
+        azs = norm_digits(r[azs_i])
+        plnum = norm_digits(r[plnum_i])
+
+        # строгость форматов
+        if not _is_azs(azs) or not _is_plnum(plnum):
+            continue
+
+        arm = r[arm_i].strip()
+        ip = r[ip_i].strip() or r[ip_alt_i].strip()
+        val_raw = r[val_i].strip()
+        src_ts = r[ts_i].strip()
+
+        # pick_tid отдаёт только "" или ровно 8 цифр (TID_RE) — отдельная проверка не нужна
+        tid = pick_tid(val_raw)
+
+        if not arm:
+            arm = "UNKNOWN"
+
+        yield (azs, arm, plnum, ip, tid, val_raw, src_ts, source_file, imported_at_utc)
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--db", default="data/agent.db")
@@ -50,71 +127,38 @@ def main():
             sample = f.read(4096)
         delimiter = csv.Sniffer().sniff(sample).delimiter
 
-    rows = []
     with open(csv_path, "r", encoding=args.encoding, newline="") as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        if not reader.fieldnames:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if not header:
             raise SystemExit("CSV has no header / fieldnames")
 
-        for r in reader:
-            azs = norm_digits(r.get("AZS") or r.get("﻿AZS") or "")
-            arm = (r.get("ARM") or "").strip()
-            plnum = norm_digits(r.get("PlNum") or "")
-            ip = (r.get("IP") or r.get("Ip") or "").strip()
-            val_raw = (r.get("Val") or "").strip()
-            src_ts = (r.get("Timestamp") or "").strip()
-
-            tid = pick_tid(val_raw)
-
-            # строгость форматов
-            if not re.fullmatch(r"\d{2,4}", azs):
-                continue
-            if not re.fullmatch(r"\d{1,2}", plnum):
-                continue
-            if tid and not re.fullmatch(r"\d{8}", tid):
-                continue
-
-            if not arm:
-                arm = "UNKNOWN"
-
-            rows.append((azs, arm, plnum, ip, tid, val_raw, src_ts))
-
-    print(f"Prepared rows: {len(rows)}")
-    if args.dry_run:
-        print("Sample:", rows[:5])
-        return
-
-    con = sqlite3.connect(args.db)
-    try:
-        con.execute("BEGIN")
-        con.executemany(
-            """
-            INSERT INTO terminal_directory(
-              azs, arm, plnum,
-              ip, tid, serial_number,
-              val_raw, src_timestamp, source_file, imported_at_utc
-            )
-            VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?)
-            ON CONFLICT(azs, arm, plnum) DO UPDATE SET
-              ip=excluded.ip,
-              tid=excluded.tid,
-              val_raw=excluded.val_raw,
-              src_timestamp=excluded.src_timestamp,
-              source_file=excluded.source_file,
-              imported_at_utc=excluded.imported_at_utc
-            """,
-            [
-                (azs, arm, plnum, ip, tid, val_raw, src_ts, str(csv_path), imported_at_utc)
-                for (azs, arm, plnum, ip, tid, val_raw, src_ts) in rows
-            ],
-        )
-        con.commit()
-        print("Import done.")
-    except Exception:
-        con.rollback()
-        raise
-    finally:
-        con.close()
+        # строки справочника идут потоком: в памяти не больше одного чанка
+        rows = iter_rows(reader, header, str(csv_path), imported_at_utc)
+
+        if args.dry_run:
+            sample = list(islice(rows, 5))
+            prepared = len(sample) + sum(1 for _ in rows)
+            print(f"Prepared rows: {prepared}")
+            print("Sample:", sample)
+            return
+
+        con = connect(args.db)
+        try:
+            # одна транзакция на весь файл (откат целиком при ошибке),
+            # executemany — чанками по CHUNK_SIZE строк
+            prepared = 0
+            with tx(con):
+                while True:
+                    chunk = list(islice(rows, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    con.executemany(SQL_UPSERT_DIRECTORY, chunk)
+                    prepared += len(chunk)
+            print(f"Prepared rows: {prepared}")
+            print("Import done.")
+        finally:
+            con.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+from itertools import islice
+from pathlib import Path
+
+# storage / rules_engine — из app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from db import connect  # noqa: E402
+from rules_engine import classify_text, compile_rules, get_rules_data  # noqa: E402
+from storage import (  # noqa: E402
+    MESSAGE_COLUMNS,
+    MessageRow,
+    ingest_batch,
+    init_db,
+    with_bulk_load,
+)
+
+# сообщений на одну транзакцию ingest_batch
+CHUNK_SIZE = 1000
+
+
+def iter_source_rows(src: sqlite3.Connection):
+    """messages источника -> MessageRow; колонок, которых в старой БД нет, — NULL."""
+    have = {row[1] for row in src.execute("PRAGMA table_info(messages)").fetchall()}
+    if not have:
+        raise SystemExit("Source DB has no messages table")
+    cols = [c for c in MESSAGE_COLUMNS if c in have]
+    cur = src.execute(f"SELECT {', '.join(cols)} FROM messages ORDER BY id")
+    for values in cur:
+        yield MessageRow(**dict(zip(cols, values)))
+
+
+def classify(text: str | None, rules) -> dict | None:
+    res = classify_text(text or "", rules)
+    if not res:
+        return None
+    return {"code": res.code, "rule_id": res.rule_id, "weight": res.weight}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Re-ingest message history from another DB with the current rules/entities"
+    )
+    ap.add_argument("--src", required=True, help="Source sqlite DB (read-only)")
+    ap.add_argument("--db", default="data/agent.db", help="Target sqlite DB (schema must exist)")
+    ap.add_argument("--dry-run", action="store_true", help="Only count source messages")
+    args = ap.parse_args()
+
+    src_path = Path(args.src)
+    if not src_path.exists():
+        raise SystemExit(f"Source DB not found: {src_path}")
+    if src_path.resolve() == Path(args.db).resolve():
+        raise SystemExit("--src and --db must be different files")
+
+    rules_data = get_rules_data()
+    rules = compile_rules(rules_data)
+    ruleset_version = str(rules_data.get("ruleset_version", "0"))
+
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True, isolation_level=None)
+    try:
+        rows = iter_source_rows(src)
+        if args.dry_run:
+            print(f"Source messages: {sum(1 for _ in rows)}")
+            return 0
+
+        init_db(args.db)
+        con = connect(args.db)
+        try:
+            replayed = 0
+            with with_bulk_load(con):
+                while True:
+                    chunk = list(islice(rows, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    ingest_batch(
+                        con,
+                        [(row, classify(row.text, rules), None) for row in chunk],
+                        ruleset_version,
+                    )
+                    replayed += len(chunk)
+            print(f"Replayed messages: {replayed}")
+        finally:
+            con.close()
+    finally:
+        src.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())